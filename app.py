@@ -1,23 +1,49 @@
 # app.py
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uuid
 import os
+import socket
+import threading
+import time
 
 # import json
 from datetime import datetime
-from typing import Dict, Optional
-# import asyncio
+from typing import Any, Dict, List, Optional
+import asyncio
 # from pathlib import Path
 
 # Import your existing modules
-from services.download_transcript import get_youtube_transcript as transcript
+from services.download_transcript import (
+    get_youtube_transcript as transcript,
+    http_client as transcript_http_client,
+    transcript_cache,
+)
+from services.extract_youtube_id import extract_id
 from services.generate_manifest import (
     generate_manifest_from_transcript as generate_manifest,
+    manifest_cache,
+)
+from services.key_pool import get_key_pool
+from services.metrics import TASK_RETRIES, TASK_SECONDS, registry
+from services.tracing import build_timings, to_chrome_trace
+from services.scaffold_project import (
+    StreamingScaffold,
+    scaffold,
+    stream_project_zip,
 )
-from services.scaffold_project import scaffold
+from services.worker_pool import WorkerPool, QueueFull
+from services.admission import Admission, Rejected
+from services.cancellation import CancelToken, TaskCancelled
+from services.resilience import breakers, providers_retry_after
+from services.job_queue import open_job_queue
+from services.single_flight import SingleFlight
+from services.task_store import FINISHED_STATUSES, SQLiteTaskStore, open_task_store
+from services.task_events import TaskEvents
+from services.janitor import Janitor, remove_artifacts
 
 
 # app = FastAPI(title="YouTube Tutorial Scaffold API", version="1.0.0")
@@ -43,12 +69,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory task storage (in production, use Redis or database)
-tasks: Dict[str, Dict] = {}
+# Task records: SQLite (WAL) by default, shared by every worker process and
+# kept across restarts; TASK_STORE=memory keeps them in this process only
+tasks = open_task_store()
+
+# Set PERSIST_TASK_ARTIFACTS=1 to also keep each task's transcript and
+# manifest on disk (/tmp/{task_id}_transcript.txt, /tmp/{task_id}_manifest.json)
+PERSIST_TASK_ARTIFACTS = os.getenv("PERSIST_TASK_ARTIFACTS", "0") == "1"
+
+# How projects are packaged:
+#   "zip"    - write /tmp/{task_id}_project.zip straight from the manifest (default)
+#   "dir"    - same, plus the expanded /tmp/{task_id}_project directory
+#   "stream" - keep only the manifest; /download streams the zip on the fly
+SCAFFOLD_MODE = os.getenv("SCAFFOLD_MODE", "zip")
+
+# Set MANIFEST_STREAMING=1 to stream Gemini output: files are added to the zip
+# as soon as they are complete and progress ("files_done") is published
+MANIFEST_STREAMING = os.getenv("MANIFEST_STREAMING", "0") == "1"
+
+# Manifests of completed tasks in "stream" mode, keyed by task_id
+project_manifests: Dict[str, Dict] = {}
+
+# Concurrent submissions for the same video share one running job
+flights = SingleFlight()
+
+# Wakes up /events subscribers when update_task_status changes a task
+task_events = TaskEvents()
+
+# /events re-reads the task store at least this often, which also picks up
+# changes made by other worker processes
+EVENTS_RECHECK_INTERVAL = float(os.getenv("EVENTS_RECHECK_INTERVAL", "2"))
+EVENTS_KEEPALIVE = 15  # seconds between keep-alive comments on idle streams
+
+# Longest ?wait= accepted by /status long-polls
+STATUS_MAX_WAIT = float(os.getenv("STATUS_MAX_WAIT", "60"))
+
+# Cancel tokens of the jobs running in this process, keyed by task_id.
+# DELETE /tasks cancels them directly; jobs in other processes (process
+# pool, queue workers, other API workers) notice their task is gone from
+# the shared store within CANCEL_CHECK_INTERVAL seconds
+running_jobs: Dict[str, CancelToken] = {}
+CANCEL_CHECK_INTERVAL = float(os.getenv("CANCEL_CHECK_INTERVAL", "1"))
 
 
 class VideoRequest(BaseModel):
     url: str
+    use_cache: bool = True  # set to False to bypass the transcript/manifest caches
 
 
 class TaskResponse(BaseModel):
@@ -65,73 +131,538 @@ class TaskStatus(BaseModel):
     completed_at: Optional[str] = None
     download_url: Optional[str] = None
     error: Optional[str] = None
+    cache: Optional[Dict[str, str]] = None  # per-stage cache status
+    coalesced_with: Optional[str] = None  # task whose job this one shares
+    files_done: Optional[int] = None  # files generated so far (streaming mode)
+    repairs: Optional[List[str]] = None  # fixes applied to the model's JSON
+    version: int = 0  # bumped on every change; the ETag of /status
+    timings: Optional[Dict[str, Any]] = None  # per-stage timing breakdown
 
 
 def update_task_status(
-    task_id: str, status: str, message: str, error: str = None, download_url: str = None
+    task_id: str,
+    status: str,
+    message: str,
+    error: str = None,
+    download_url: str = None,
+    **fields,
 ):
-    """Update task status in storage"""
-    if task_id in tasks:
-        tasks[task_id].update(
-            {
-                "status": status,
-                "message": message,
-                "error": error,
-                "download_url": download_url,
-            }
-        )
-        if status in ["completed", "failed"]:
-            tasks[task_id]["completed_at"] = datetime.now().isoformat()
+    """
+    Update task status in storage (extra keyword fields are merged in).
+
+    The update is mirrored to every task coalesced onto this one.
+    A "manifest" field is kept aside for streamed downloads, not in the record.
+    """
+    manifest = fields.pop("manifest", None)
+    if manifest is not None:
+        project_manifests[task_id] = manifest
+
+    if status in ["completed", "failed", "cancelled"]:
+        followers = flights.finish(task_id)
+    else:
+        followers = flights.followers(task_id)
+
+    for tid in [task_id] + followers:
+        _write_status(tid, status, message, error, download_url, fields)
+
+
+def update_coalesced_tasks(
+    task_id: str,
+    status: str,
+    message: str,
+    error: str = None,
+    download_url: str = None,
+    **fields,
+):
+    """
+    update_task_status for queue workers, which run outside the API process:
+    tasks coalesced onto this one are found in the store (they share its
+    artifact_id) instead of the API's SingleFlight.
+
+    The leader is written first, so a task attaching concurrently either
+    shows up in the lookup or copies the leader's new state.
+    """
+    fields.pop("manifest", None)  # streamed downloads need the API's memory
+    _write_status(task_id, status, message, error, download_url, fields)
+    for task in tasks.with_artifact(task_id):
+        if task["task_id"] != task_id:
+            _write_status(
+                task["task_id"], status, message, error, download_url, fields
+            )
+
 
+def _write_status(task_id, status, message, error, download_url, fields):
+    if status in ["completed", "failed", "cancelled"]:
+        fields.setdefault("completed_at", datetime.now().isoformat())
+    tasks.update(
+        task_id,
+        {
+            "status": status,
+            "message": message,
+            "error": error,
+            "download_url": download_url and f"/download/{task_id}",
+            **fields,
+        },
+    )
+    task_events.publish(task_id)
+
+
+def process_video_task(
+    task_id: str,
+    video_url: str,
+    use_cache: bool = True,
+    queued_at: float = None,
+    update=update_task_status,
+):
+    """
+    Worker job to process video (runs on the worker pool, off the event loop)
+
+    Stops as soon as the task is deleted: requests in flight are abandoned,
+    partial files removed and a final "cancelled" update releases the job.
+    """
+    cancel = CancelToken()
+    running_jobs[task_id] = cancel
+    shared_store = isinstance(tasks, SQLiteTaskStore)
+
+    def deleted():
+        # Deleted everywhere (coalesced tasks still count), maybe by another process
+        return not tasks.count(artifact_id=task_id)
+
+    if shared_store:
+        cancel.watch(deleted, CANCEL_CHECK_INTERVAL)
+    listener = None
+    started = time.perf_counter()
+    started_at = time.time()
+    queued_at = queued_at or started_at
+    transcription = None
+    # Filled by the services: cache status, retries and timed spans
+    transcript_info = {}
+    manifest_info = {}
+    scaffold_info = {}
+
+    def timings():
+        spans = (
+            transcript_info.get("spans", [])
+            + manifest_info.get("spans", [])
+            + scaffold_info.get("spans", [])
+        )
+        gemini_calls = [s for s in spans if s["name"] == "gemini_generate"]
+        return build_timings(
+            queued_at,
+            started_at,
+            spans,
+            transcript_chars=len(transcription) if transcription else None,
+            gemini_calls=len(gemini_calls),
+            output_tokens=sum(s.get("output_tokens") or 0 for s in gemini_calls),
+            retries={
+                "transcript": transcript_info.get("retries", 0),
+                "gemini": manifest_info.get("retries", 0),
+            },
+        )
 
-async def process_video_task(task_id: str, video_url: str):
-    """Background task to process video"""
     try:
+        cancel.check()
         # Update status to processing
-        update_task_status(task_id, "processing", "Downloading transcript...")
+        update(task_id, "processing", "Downloading transcript...")
+
+        # Stage outputs stay in memory, tied to this task
+        transcript_path = manifest_path = None
+        if PERSIST_TASK_ARTIFACTS:
+            transcript_path = f"/tmp/{task_id}_transcript.txt"
+            manifest_path = f"/tmp/{task_id}_manifest.json"
 
         # Step 1: Get transcript
-        transcription = transcript(video_url)
+        transcription = transcript(
+            video_url,
+            save_to=transcript_path,
+            use_cache=use_cache,
+            run_info=transcript_info,
+            cancel=cancel,
+        )
         if not transcription:
             raise Exception("Failed to get transcription")
+        cancel.check()
 
-        update_task_status(task_id, "processing", "Generating project manifest...")
+        cache_status = {"transcript": transcript_info.get("cache")}
+        update(
+            task_id,
+            "processing",
+            "Generating project manifest...",
+            cache=dict(cache_status),
+            timings=timings(),
+        )
 
         # Step 2: Generate manifest
-        manifest = generate_manifest()
+        if MANIFEST_STREAMING:
+            listener = StreamingScaffold(
+                task_id,
+                write_archive=SCAFFOLD_MODE == "zip",
+                on_progress=lambda n: update(
+                    task_id,
+                    "processing",
+                    f"Generating project manifest... ({n} files so far)",
+                    files_done=n,
+                ),
+                cancel=cancel,
+            )
+
+        manifest = generate_manifest(
+            transcription,
+            output_path=manifest_path,
+            use_cache=use_cache,
+            run_info=manifest_info,
+            listener=listener,
+            cancel=cancel,
+        )
         if not manifest:
             raise Exception("Failed to generate manifest")
+        cancel.check()
 
-        update_task_status(task_id, "processing", "Creating project files...")
+        cache_status["manifest"] = manifest_info.get("cache")
+        update(
+            task_id,
+            "processing",
+            "Creating project files...",
+            cache=dict(cache_status),
+            repairs=manifest_info.get("repairs"),
+            timings=timings(),
+        )
 
         # Step 3: Create project scaffold
-        scaffold(manifest=manifest, task_id=task_id)
+        if SCAFFOLD_MODE == "stream":
+            # Nothing to write: /download builds the zip from the manifest
+            completed_fields = {"manifest": manifest}
+        elif listener is not None and listener.write_archive:
+            # Most files are already in the archive; just finalize it
+            listener.finish(manifest, run_info=scaffold_info)
+            completed_fields = {}
+        else:
+            scaffold(
+                manifest=manifest,
+                task_id=task_id,
+                expand=SCAFFOLD_MODE == "dir",
+                run_info=scaffold_info,
+                cancel=cancel,
+            )
+            completed_fields = {}
+        # A deletion racing the last step must not leave the files behind
+        if shared_store and deleted():
+            cancel.cancel()
+        cancel.check()
 
         # Update status to completed
         download_url = f"/download/{task_id}"
-        update_task_status(
+        update(
             task_id,
             "completed",
             "Project scaffold created successfully",
             download_url=download_url,
+            files_done=len(manifest["files"]),
+            timings=timings(),
+            **completed_fields,
         )
+        outcome = "completed"
+
+    except TaskCancelled:
+        print(f"🛑 Task {task_id} cancelled")
+        if listener is not None:
+            listener.abort()
+        project_manifests.pop(task_id, None)
+        remove_artifacts(task_id)
+        update(task_id, "cancelled", "Task was cancelled")
+        outcome = "cancelled"
 
     except Exception as e:
+        if listener is not None:
+            listener.abort()
         # Update status to failed
-        update_task_status(task_id, "failed", "Failed to process video", error=str(e))
+        update(
+            task_id,
+            "failed",
+            "Failed to process video",
+            error=str(e),
+            timings=timings(),
+        )
+        outcome = "failed"
+
+    finally:
+        running_jobs.pop(task_id, None)
+        cancel.close()
+
+    TASK_SECONDS.observe(time.perf_counter() - started, status=outcome)
+    TASK_RETRIES.observe(transcript_info.get("retries", 0), stage="transcript")
+    TASK_RETRIES.observe(manifest_info.get("retries", 0), stage="gemini")
+
+
+# Job execution engine: bounded queue + worker pool (see services/worker_pool.py).
+# WORKER_MODE=queue splits API and workers instead: /process only enqueues
+# jobs in a durable SQLite queue (services/job_queue.py), and any number of
+# `python worker.py` processes run them
+WORKER_MODE = os.getenv("WORKER_MODE", "thread")
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "100"))
+if WORKER_MODE == "queue":
+    if not isinstance(tasks, SQLiteTaskStore):
+        raise ValueError("WORKER_MODE=queue needs TASK_STORE=sqlite")
+    job_queue = open_job_queue()
+    worker_pool = None
+else:
+    job_queue = None
+    worker_pool = WorkerPool(
+        process_video_task,
+        on_update=update_task_status,
+        workers=int(os.getenv("WORKER_CONCURRENCY", "4")),
+        queue_size=QUEUE_MAX_SIZE,
+        mode=WORKER_MODE,
+        # Jobs wait in the queue while a provider's circuit breaker is open
+        # (breakers of process workers live in the children, so not there)
+        gate=providers_retry_after,
+    )
+
+
+# Admission control on /process: each client gets CLIENT_RATE_LIMIT submissions
+# per minute and at most CLIENT_MAX_ACTIVE unfinished tasks; over a limit, or
+# when the queue is full, it gets 429 with a Retry-After. Clients are told
+# apart by IP: behind Vercel or a reverse proxy (TRUST_FORWARDED_FOR=1), the
+# X-Forwarded-For hop added by the outermost of our TRUSTED_PROXY_COUNT
+# proxies (hops left of it are whatever the client sent), else the peer address
+admission = Admission(
+    rate=float(os.getenv("CLIENT_RATE_LIMIT", "20")),
+    max_active=int(os.getenv("CLIENT_MAX_ACTIVE", "5")),
+    active_count=tasks.count_active,
+)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+TRUSTED_PROXY_COUNT = max(1, int(os.getenv("TRUSTED_PROXY_COUNT", "1")))
+DEFAULT_TASK_SECONDS = 60  # Retry-After basis until a task has completed
+
+
+# Tasks run by this process's worker pool are leased to it; the lease is
+# renewed while it runs, so if it dies (restart, crash) the janitor fails
+# them instead of leaving them in progress and counted against the client
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_leases_stop = threading.Event()
+
+
+def renew_task_leases():
+    interval = getattr(tasks, "lease", 60) / 3
+    while not _leases_stop.wait(interval):
+        try:
+            tasks.renew(INSTANCE_ID)
+        except Exception as e:
+            print(f"⚠️ Task lease renewal failed: {e}")
+
+
+# Background cleanup: finished tasks are dropped after TASK_RETENTION seconds
+# and project files are kept under ARTIFACT_MAX_MB (least recently used go first)
+janitor = Janitor(
+    tasks,
+    retention=float(os.getenv("TASK_RETENTION", "86400")),
+    max_bytes=int(float(os.getenv("ARTIFACT_MAX_MB", "1024")) * 2**20),
+    interval=float(os.getenv("JANITOR_INTERVAL", "60")),
+    on_remove=lambda artifact_id: project_manifests.pop(artifact_id, None),
+)
+
+
+# Prometheus metrics (see services/metrics.py); stage histograms are recorded
+# by the services, live state is read on every scrape
+HTTP_REQUESTS = registry.counter(
+    "y2p_http_requests_total",
+    "HTTP requests handled, by method, route and status code",
+    labels=("method", "route", "status"),
+)
+HTTP_SECONDS = registry.histogram(
+    "y2p_http_request_duration_seconds",
+    "Time to response headers, by route",
+    labels=("route",),
+)
+QUEUE_DEPTH = registry.gauge("y2p_queue_depth", "Jobs waiting for a worker")
+IN_FLIGHT = registry.gauge("y2p_tasks_in_flight", "Jobs running on a worker")
+WORKERS = registry.gauge("y2p_workers", "Size of the worker pool")
+COALESCED = registry.gauge(
+    "y2p_coalesced_jobs", "Running jobs that other submissions are attached to"
+)
+WAITING_CLIENTS = registry.gauge(
+    "y2p_waiting_clients", "Clients with jobs waiting (served round-robin)"
+)
+REJECTIONS = registry.counter(
+    "y2p_rejected_submissions_total",
+    "Submissions answered with 429, by reason (queue_full, rate, active)",
+    labels=("reason",),
+)
+EVENT_SUBSCRIBERS = registry.gauge(
+    "y2p_event_subscribers", "Open /events streams and waiting long-polls"
+)
+TASKS_BY_STATUS = registry.gauge(
+    "y2p_tasks", "Task records in the store, by status", labels=("status",)
+)
+CACHE_EVENTS = registry.counter(
+    "y2p_cache_requests_total",
+    "Cache lookups by result (hit = memory, disk_hit, miss)",
+    labels=("cache", "result"),
+)
+CACHE_HIT_RATIO = registry.gauge(
+    "y2p_cache_hit_ratio", "Share of cache lookups served", labels=("cache",)
+)
+CACHE_ENTRIES = registry.gauge(
+    "y2p_cache_entries", "Entries held in memory", labels=("cache",)
+)
+KEY_CALLS = registry.counter(
+    "y2p_gemini_key_calls_total", "Gemini calls made with each API key", labels=("key",)
+)
+KEY_ERRORS = registry.counter(
+    "y2p_gemini_key_errors_total",
+    "Failed Gemini calls per API key, by kind",
+    labels=("key", "kind"),
+)
+KEY_IN_FLIGHT = registry.gauge(
+    "y2p_gemini_key_in_flight", "Gemini calls running on each API key", labels=("key",)
+)
+KEY_AVAILABLE = registry.gauge(
+    "y2p_gemini_key_available",
+    "1 if the key can take requests now (not disabled or cooling down)",
+    labels=("key",),
+)
+ARTIFACT_BYTES = registry.gauge(
+    "y2p_artifact_bytes", "Disk used by project files at the last janitor pass"
+)
+CIRCUIT_OPEN = registry.gauge(
+    "y2p_circuit_open",
+    "1 while a provider's circuit breaker refuses calls (gemini, notegpt)",
+    labels=("provider",),
+)
+
+
+@registry.on_collect
+def collect_live_metrics():
+    if job_queue is not None:
+        queue_stats = job_queue.stats()
+        QUEUE_DEPTH.set(queue_stats["queued"])
+        IN_FLIGHT.set(queue_stats["running"])
+        WORKERS.set(queue_stats["capacity"])
+        WAITING_CLIENTS.set(queue_stats["clients"])
+    else:
+        QUEUE_DEPTH.set(worker_pool.queue_depth)
+        IN_FLIGHT.set(worker_pool.in_flight)
+        WORKERS.set(worker_pool.workers)
+        WAITING_CLIENTS.set(worker_pool.jobs.clients())
+    COALESCED.set(flights.in_flight())
+    EVENT_SUBSCRIBERS.set(task_events.subscriber_count())
+    for status in ("pending", "processing") + FINISHED_STATUSES:
+        TASKS_BY_STATUS.set(tasks.count(status=status), status=status)
+
+    for name, cache in (("transcript", transcript_cache), ("manifest", manifest_cache)):
+        stats = cache.stats()
+        CACHE_EVENTS.set(stats["hits"] - stats["disk_hits"], cache=name, result="hit")
+        CACHE_EVENTS.set(stats["disk_hits"], cache=name, result="disk_hit")
+        CACHE_EVENTS.set(stats["misses"], cache=name, result="miss")
+        CACHE_HIT_RATIO.set(stats["hit_rate"], cache=name)
+        CACHE_ENTRIES.set(stats["entries"], cache=name)
+
+    key_pool = get_key_pool(create=False)
+    for key in key_pool.stats() if key_pool else []:
+        KEY_CALLS.set(key["calls"], key=key["key"])
+        KEY_ERRORS.set(key["quota_errors"], key=key["key"], kind="quota")
+        KEY_ERRORS.set(
+            key["errors"] - key["quota_errors"], key=key["key"], kind="other"
+        )
+        KEY_IN_FLIGHT.set(key["in_flight"], key=key["key"])
+        KEY_AVAILABLE.set(
+            int(not key["disabled"] and not key["cooldown_remaining"]), key=key["key"]
+        )
+
+    ARTIFACT_BYTES.set(janitor.stats()["footprint_bytes"])
+    for name, breaker in list(breakers.items()):
+        CIRCUIT_OPEN.set(int(breaker.state == "open"), provider=name)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Route template (/status/{task_id}), not the raw path, to bound label values
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_SECONDS.observe(time.perf_counter() - started, route=route)
+    HTTP_REQUESTS.inc(
+        method=request.method, route=route, status=str(response.status_code)
+    )
+    return response
+
+
+@app.on_event("startup")
+def start_worker_pool():
+    if worker_pool is not None:
+        worker_pool.start()
+        _leases_stop.clear()
+        threading.Thread(
+            target=renew_task_leases, name="task-leases", daemon=True
+        ).start()
+    janitor.start()
+
+
+@app.on_event("shutdown")
+def stop_worker_pool():
+    _leases_stop.set()
+    janitor.shutdown()
+    if worker_pool is not None:
+        worker_pool.shutdown()
+    transcript_http_client.close()
+
+
+def client_address(request: Request) -> str:
+    """The submitting client, for quotas and fair scheduling"""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            hops = [hop.strip() for hop in forwarded.split(",")]
+            if len(hops) >= TRUSTED_PROXY_COUNT:
+                return hops[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else "unknown"
+
+
+def typical_task_seconds() -> float:
+    return TASK_SECONDS.mean(status="completed") or DEFAULT_TASK_SECONDS
+
+
+def too_many_requests(error: Rejected) -> HTTPException:
+    REJECTIONS.inc(reason=error.reason)
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def queue_full(error: QueueFull) -> HTTPException:
+    """429 for a saturated queue, suggesting when a worker should be free"""
+    if job_queue is not None:
+        queue_stats = job_queue.stats()
+        waiting, workers = queue_stats["queued"], queue_stats["capacity"]
+    else:
+        waiting, workers = worker_pool.queue_depth, worker_pool.workers
+    retry_after = waiting / max(workers, 1) * typical_task_seconds()
+    return too_many_requests(Rejected(str(error), retry_after, "queue_full"))
 
 
 @app.post("/process", response_model=TaskResponse)
-async def process_video(request: VideoRequest, background_tasks: BackgroundTasks):
+def process_video(request: VideoRequest, http_request: Request):
     """
     Submit a YouTube video for processing
     Returns a task ID to track progress
+
+    Answers 429 with a Retry-After header when the client is over its quota
+    or the queue is full. Like every route touching the task store, it is
+    a plain def: SQLite calls can wait on a lock and must not block the loop.
     """
+    client = client_address(http_request)
+    try:
+        admission.check(client, typical_task_seconds())
+    except Rejected as e:
+        raise too_many_requests(e)
+
     # Generate unique task ID
     task_id = str(uuid.uuid4())
 
     # Initialize task in storage
-    tasks[task_id] = {
+    record = {
         "task_id": task_id,
         "status": "pending",
         "message": "Task queued for processing",
@@ -140,10 +671,42 @@ async def process_video(request: VideoRequest, background_tasks: BackgroundTasks
         "completed_at": None,
         "download_url": None,
         "error": None,
+        "cache": None,
+        "coalesced_with": None,
+        "files_done": None,
+        "repairs": None,
+        "artifact_id": task_id,  # task whose files hold the project zip
+        "client": client,
+        # Queued jobs outlive this process: only the pool's tasks are leased
+        "owner": INSTANCE_ID if job_queue is None else None,
     }
 
-    # Add background task
-    background_tasks.add_task(process_video_task, task_id, request.url)
+    if job_queue is not None:
+        return enqueue_job(record, request)
+
+    # The record exists before joining, so the leader's updates always find it
+    tasks.create(record)
+
+    # Attach to a job already running for this video, if any
+    leader = flights.join(extract_id(request.url), task_id)
+    if leader is not None:
+        task = attach_to_leader(task_id, leader)
+        return TaskResponse(
+            task_id=task_id,
+            status=task["status"],
+            message="Attached to a running job for the same video. "
+            "Use /status/{task_id} to check progress.",
+        )
+
+    # Hand the job to the worker pool
+    try:
+        worker_pool.submit(
+            task_id, request.url, request.use_cache, time.time(), client=client
+        )
+    except QueueFull as e:
+        for tid in [task_id] + flights.finish(task_id):
+            tasks.delete(tid)
+        raise queue_full(e)
 
     return TaskResponse(
         task_id=task_id,
@@ -152,40 +715,257 @@ async def process_video(request: VideoRequest, background_tasks: BackgroundTasks
     )
 
 
+def enqueue_job(record: dict, request: VideoRequest) -> TaskResponse:
+    """/process in WORKER_MODE=queue: hand the job to the durable queue"""
+    task_id = record["task_id"]
+    tasks.create(record)
+    try:
+        leader = job_queue.put(
+            task_id,
+            {
+                "video_url": request.url,
+                "use_cache": request.use_cache,
+                "queued_at": time.time(),
+            },
+            key=extract_id(request.url),
+            max_queued=QUEUE_MAX_SIZE,
+            client=record["client"],
+        )
+    except QueueFull as e:
+        tasks.delete(task_id)
+        raise queue_full(e)
+
+    if leader is None:
+        return TaskResponse(
+            task_id=task_id,
+            status="pending",
+            message="Video queued for processing. "
+            "Use /status/{task_id} to check progress.",
+        )
+
+    # Share the queued/running job for this video: from now on the worker's
+    # updates reach this task too
+    task = attach_to_leader(task_id, leader)
+    return TaskResponse(
+        task_id=task_id,
+        status=task["status"],
+        message="Attached to a running job for the same video. "
+        "Use /status/{task_id} to check progress.",
+    )
+
+
+def attach_to_leader(task_id: str, leader: str) -> dict:
+    """
+    Point an existing task at leader's job and copy the state it missed so
+    far; returns the task's record.
+    """
+    tasks.update(task_id, {"coalesced_with": leader, "artifact_id": leader})
+    leader_task = tasks.get(leader)
+    if leader_task is not None:
+        _copy_leader_state(task_id, leader_task)
+        # The leader's last update may have landed between the read and the
+        # copy; a finished leader never changes again, so copy that for sure
+        leader_task = tasks.get(leader)
+        if leader_task is not None and leader_task["status"] in FINISHED_STATUSES:
+            _copy_leader_state(task_id, leader_task)
+    return tasks.get(task_id)
+
+
+def _copy_leader_state(task_id: str, leader_task: dict):
+    fields = {
+        field: leader_task.get(field)
+        for field in (
+            "status",
+            "message",
+            "error",
+            "cache",
+            "files_done",
+            "repairs",
+            "completed_at",
+        )
+    }
+    fields["download_url"] = leader_task.get("download_url") and (
+        f"/download/{task_id}"
+    )
+    tasks.update(task_id, fields)
+    task_events.publish(task_id)
+
+
+def task_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+async def wait_for_version_change(task_id: str, version: int, timeout: float):
+    """Wait until the task's version differs from version (or timeout)"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    wake = task_events.subscribe(task_id)
+    try:
+        while True:
+            current = await run_in_threadpool(tasks.version, task_id)
+            remaining = deadline - loop.time()
+            if current != version or remaining <= 0:
+                return current
+            try:
+                await asyncio.wait_for(
+                    wake.wait(), min(remaining, EVENTS_RECHECK_INTERVAL)
+                )
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+    finally:
+        task_events.unsubscribe(task_id, wake)
+
+
 @app.get("/status/{task_id}", response_model=TaskStatus)
-async def get_task_status(task_id: str):
+async def get_task_status(
+    task_id: str,
+    response: Response,
+    wait: float = Query(0, ge=0, le=STATUS_MAX_WAIT),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Get the status of a processing task
+
+    Responses carry an ETag (the task's version). Send it back in
+    If-None-Match to get 304 Not Modified while nothing has changed; add
+    ?wait=N to hold the request up to N seconds until the task changes.
     """
-    if task_id not in tasks:
+    version = await run_in_threadpool(tasks.version, task_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    task = tasks[task_id]
+    if wait and etag_matches(if_none_match, task_etag(version)):
+        version = await wait_for_version_change(task_id, version, wait)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+    headers = {"ETag": task_etag(version), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    task = await run_in_threadpool(tasks.get, task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    response.headers["ETag"] = task_etag(task["version"])
+    response.headers["Cache-Control"] = "no-cache"
     return TaskStatus(**task)
 
 
+async def task_event_stream(task_id: str):
+    """Server-Sent Events: the task record each time it changes"""
+    wake = task_events.subscribe(task_id)
+    try:
+        last = None
+        idle = 0.0
+        while True:
+            task = await run_in_threadpool(tasks.get, task_id)
+            if task is None:
+                yield "event: deleted\ndata: {}\n\n"
+                return
+            payload = TaskStatus(**task).model_dump_json()
+            if payload != last:
+                yield f"event: status\ndata: {payload}\n\n"
+                last = payload
+                idle = 0.0
+                if task["status"] in FINISHED_STATUSES:
+                    return
+            try:
+                await asyncio.wait_for(wake.wait(), EVENTS_RECHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                idle += EVENTS_RECHECK_INTERVAL
+                if idle >= EVENTS_KEEPALIVE:
+                    yield ": keep-alive\n\n"
+                    idle = 0.0
+            wake.clear()
+    finally:
+        task_events.unsubscribe(task_id, wake)
+
+
+@app.get("/events/{task_id}")
+def stream_task_events(task_id: str):
+    """
+    Stream status changes of a task as Server-Sent Events
+
+    Sends the current status right away, then every change (stage, files
+    generated, completion with download_url) and closes once the task is
+    finished.
+    """
+    if tasks.get(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return StreamingResponse(
+        task_event_stream(task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/tasks/{task_id}/trace")
+def export_task_trace(task_id: str):
+    """
+    Export the task's timing breakdown as trace spans (Chrome Trace Event
+    format: open in chrome://tracing or ui.perfetto.dev)
+    """
+    task = tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not task.get("timings"):
+        raise HTTPException(status_code=404, detail="No timings recorded yet")
+    return to_chrome_trace(task_id, task["timings"])
+
+
 @app.get("/download/{task_id}")
-async def download_project(task_id: str):
+def download_project(task_id: str):
     """
     Download the generated project zip file
     """
-    if task_id not in tasks:
+    task = tasks.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    task = tasks[task_id]
-
     if task["status"] != "completed":
         raise HTTPException(
             status_code=400,
             detail=f"Project not ready. Current status: {task['status']}",
         )
 
-    # FIXED: Find the zip file in /tmp
-    zip_path = f"/tmp/{task_id}_project.zip"
+    artifact_id = task.get("artifact_id", task_id)
+
+    # Streamed mode: build the zip from the manifest while sending it
+    if artifact_id in project_manifests:
+        return StreamingResponse(
+            stream_project_zip(project_manifests[artifact_id]),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="youtube_project_{task_id}.zip"'
+            },
+        )
+
+    # FIXED: Find the zip file in /tmp (coalesced tasks share their leader's)
+    zip_path = f"/tmp/{artifact_id}_project.zip"
 
     if not os.path.exists(zip_path):
         raise HTTPException(status_code=404, detail="Project file not found")
 
+    # Mark the zip as recently used for the janitor's LRU eviction
+    try:
+        os.utime(zip_path)
+    except OSError:
+        pass
+
     return FileResponse(
         zip_path,
         media_type="application/zip",
@@ -194,41 +974,101 @@ async def download_project(task_id: str):
 
 
 @app.get("/tasks")
-async def list_all_tasks():
+def list_all_tasks(
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
     """
-    List all tasks (for debugging/admin purposes)
+    List tasks, newest first (for debugging/admin purposes)
+
+    Pass the returned next_cursor as ?cursor= to get the next page.
     """
-    return {"tasks": list(tasks.values())}
+    try:
+        page, next_cursor = tasks.list(status=status, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tasks": page, "next_cursor": next_cursor}
+
+
+def cancel_job(task_id: str):
+    """
+    Stop the job of a task nobody needs any more: drop it from the queue, or
+    cancel it where it runs so its worker slot and API key free up at once
+    """
+    if job_queue is not None:
+        # The worker running it (if any) notices the task is gone
+        job_queue.cancel(task_id)
+        return
+    worker_pool.cancel(lambda args: args[0] == task_id)
+    # New submissions for the video must not attach to the dying job
+    flights.finish(task_id)
+    token = running_jobs.get(task_id)
+    if token is not None:
+        token.cancel()
 
 
 @app.delete("/tasks/{task_id}")
-async def delete_task(task_id: str):
+def delete_task(task_id: str):
     """
     Delete a task and its associated files
+
+    The job behind it is cancelled too, unless coalesced tasks still share it.
     """
-    if task_id not in tasks:
+    task = tasks.delete(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    # FIXED: Remove files from /tmp
-    zip_path = f"/tmp/{task_id}_project.zip"
-    project_dir = f"/tmp/{task_id}_project"
+    task_events.publish(task_id)
+    artifact_id = task.get("artifact_id", task_id)
+    if task.get("coalesced_with"):
+        flights.leave(task["coalesced_with"], task_id)
 
-    try:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-        if os.path.exists(project_dir):
-            import shutil
+    # Files shared with coalesced tasks stay until the last of them is deleted
+    if tasks.count(artifact_id=artifact_id):
+        return {"message": "Task deleted successfully"}
+
+    cancel_job(artifact_id)
+    project_manifests.pop(artifact_id, None)
 
-            shutil.rmtree(project_dir)
+    # FIXED: Remove files from /tmp
+    try:
+        remove_artifacts(artifact_id)
     except Exception as e:
         print(f"Error cleaning up files: {e}")
 
-    # Remove from tasks
-    del tasks[task_id]
-
     return {"message": "Task deleted successfully"}
 
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Hit/miss counters for the pipeline caches
+    """
+    return {
+        "transcript": transcript_cache.stats(),
+        "manifest": manifest_cache.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus metrics of this process
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    """
+    Janitor activity and current disk footprint of project files
+    """
+    return janitor.stats()
+
+
 #################################################
 
 
@@ -244,14 +1084,19 @@ async def root():
         "endpoints": {
             "POST /process": "Submit video for processing",
             "GET /status/{task_id}": "Check task status",
+            "GET /events/{task_id}": "Stream status changes (Server-Sent Events)",
             "GET /download/{task_id}": "Download completed project",
-            "GET /tasks": "List all tasks",
+            "GET /tasks": "List tasks (?status=, ?limit=, ?cursor=)",
+            "GET /tasks/{task_id}/trace": "Stage timings as trace spans",
             "DELETE /tasks/{task_id}": "Delete task and files",
+            "GET /cache/stats": "Cache hit/miss counters",
+            "GET /storage/stats": "Disk footprint and janitor activity",
+            "GET /metrics": "Prometheus metrics (stage latencies, queue, caches, keys)",
         },
         "usage": {
             "1": "POST your YouTube URL to /process",
             "2": "Get task_id in response",
-            "3": "Check status with GET /status/{task_id}",
+            "3": "Follow progress with GET /events/{task_id} (or poll GET /status/{task_id})",
             "4": "When status is 'completed', download with GET /download/{task_id}",
         },
     }
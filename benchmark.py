@@ -0,0 +1,853 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for the API
+
+Starts local stand-ins for the notegpt transcript API and the Gemini
+generate endpoint (configurable latency, error and 429 rates, response
+sizes), runs app.py against them with uvicorn and drives
+POST /process -> /status -> /download from N concurrent clients.
+Reports tasks/sec, per-stage percentiles, server memory and disk
+footprint, and saves the results as JSON so runs can be compared.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from services.janitor import scan_artifacts
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ID_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-"
+
+# Headline numbers shown by --compare (path in the results, lower is better?)
+COMPARED = [
+    ("tasks_per_sec", False),
+    ("latency.end_to_end.p50", True),
+    ("latency.end_to_end.p95", True),
+    ("latency.end_to_end.p99", True),
+    ("stages.queue_wait.p95", True),
+    ("stages.gemini_generate.p95", True),
+    ("stages.zip.p95", True),
+    ("memory.peak_rss_mb", True),
+    ("disk.peak_mb", True),
+]
+
+
+def log(message: str):
+    print(message, flush=True)
+
+
+# ─── Fake upstreams ────────────────────────────────────────────────────────────
+
+
+class FakeUpstream:
+    """
+    Latency, failure injection and request counting shared by the fake
+    servers. Latency is uniform within ±jitter of the configured mean.
+    """
+
+    def __init__(
+        self, latency: float, jitter: float, error_rate: float, rate_429: float
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def delay(self):
+        if self.latency > 0:
+            spread = self.latency * self.jitter
+            time.sleep(
+                max(0.0, random.uniform(self.latency - spread, self.latency + spread))
+            )
+
+    def outcome(self) -> int:
+        """HTTP status to answer with: 200, 429 or 500"""
+        roll = random.random()
+        with self.lock:
+            self.stats["requests"] += 1
+            if roll < self.rate_429:
+                self.stats["rate_limited"] += 1
+                return 429
+            if roll < self.rate_429 + self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+        return 200
+
+
+def fake_transcript(video_id: str, size_kb: float) -> dict:
+    """notegpt-shaped response with about size_kb of transcript text"""
+    words = ["function", "variable", "component", "install", "route", "model", "test"]
+    rng = random.Random(video_id)
+    segments, size = [], 0
+    while size < size_kb * 1024:
+        text = " ".join(rng.choice(words) for _ in range(12))
+        segments.append({"text": text})
+        size += len(text) + 1
+    return {"code": 100000, "data": {"transcripts": {"en": {"custom": segments}}}}
+
+
+def fake_manifest_text(files: int, file_kb: float) -> str:
+    """A fenced manifest like the model returns, with `files` files of file_kb"""
+    line = "print('benchmark payload line')\n"
+    content = line * max(1, int(file_kb * 1024 / len(line)))
+    manifest = {
+        "folders": ["src", "tests"],
+        "files": {f"src/module_{i}.py": content for i in range(files)},
+    }
+    manifest["files"]["README.md"] = "# Benchmark project\n"
+    return "```json\n" + json.dumps(manifest, indent=2) + "\n```"
+
+
+def _gemini_payload(text: str, finish_reason: str = None, usage: bool = False) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    payload = {"candidates": [candidate]}
+    if usage:
+        tokens = len(text) // 4
+        payload["usageMetadata"] = {
+            "promptTokenCount": 1000,
+            "candidatesTokenCount": tokens,
+            "totalTokenCount": 1000 + tokens,
+        }
+    return payload
+
+
+def make_handler(name: str, upstream: FakeUpstream, config: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _fail(self, status: int):
+            if status == 429:
+                self._send_json(
+                    429,
+                    {
+                        "error": {
+                            "code": 429,
+                            "status": "RESOURCE_EXHAUSTED",
+                            "message": "429 Resource has been exhausted",
+                        }
+                    },
+                )
+            else:
+                self._send_json(
+                    500,
+                    {
+                        "error": {
+                            "code": 500,
+                            "status": "INTERNAL",
+                            "message": "Injected benchmark error",
+                        }
+                    },
+                )
+
+        def do_GET(self):
+            # notegpt: GET ?platform=youtube&video_id=...
+            upstream.delay()
+            status = upstream.outcome()
+            if status != 200:
+                return self._fail(status)
+            video_id = self.path.rsplit("video_id=", 1)[-1].split("&")[0]
+            self._send_json(200, fake_transcript(video_id, config["transcript_kb"]))
+
+        def do_POST(self):
+            # Gemini REST: /v1beta/models/{model}:generateContent or
+            # :streamGenerateContent (a JSON array sent in pieces)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            upstream.delay()
+            status = upstream.outcome()
+            if status != 200:
+                return self._fail(status)
+            text = config["manifest_text"]
+            if ":streamGenerateContent" not in self.path:
+                return self._send_json(200, _gemini_payload(text, "STOP", usage=True))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = [text[i : i + 2048] for i in range(0, len(text), 2048)]
+            for i, piece in enumerate(pieces):
+                last = i == len(pieces) - 1
+                payload = _gemini_payload(piece, "STOP" if last else None, usage=last)
+                data = ("[" if i == 0 else ",\r\n") + json.dumps(payload)
+                if last:
+                    data += "]"
+                data = data.encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    Handler.__name__ = f"{name}Handler"
+    return Handler
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a slow response are part of the test
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(handler) -> FakeServer:
+    server = FakeServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ─── API server under test ─────────────────────────────────────────────────────
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(args, workdir: str, notegpt_url: str, gemini_url: str):
+    """
+    Start app.py under uvicorn against the fakes, plus --queue-workers
+    worker.py processes. Returns (processes, base_url), the API first.
+    """
+    port = free_port()
+    env = dict(os.environ)
+    env.update(
+        NOTEGPT_API_URL=notegpt_url,
+        GEMINI_API_ENDPOINT=gemini_url,
+        GEMINI_API_KEY=";".join(f"bench-key-{i}" for i in range(args.keys)),
+        GEMINI_KEY_RPM=str(args.key_rpm),
+        TASK_DB_PATH=os.path.join(workdir, "tasks.db"),
+        CACHE_DIR=os.path.join(workdir, "cache"),
+        # Every client gets its own address (X-Forwarded-For) so fair
+        # scheduling sees them apart; quotas are off unless given with -e
+        TRUST_FORWARDED_FOR="1",
+        CLIENT_RATE_LIMIT="0",
+        CLIENT_MAX_ACTIVE="0",
+    )
+    if args.queue_workers:
+        env["WORKER_MODE"] = "queue"
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log_file = open(os.path.join(workdir, "server.log"), "w")
+    processes = []
+    for _ in range(args.queue_workers):
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, "worker.py"],
+                cwd=ROOT,
+                env=env,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+            )
+        )
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    processes.insert(0, process)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited, see {log_file.name}")
+        try:
+            requests.get(f"{base_url}/", timeout=1)
+            return processes, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_processes(processes)
+    raise RuntimeError("API server did not start within 60 seconds")
+
+
+def stop_processes(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _descendants(pid: int) -> list:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        found.append(current)
+        stack.extend(children.get(current, ()))
+    return found
+
+
+def tree_rss_mb(pids: list):
+    """RSS of processes and their children (worker processes), None off Linux"""
+    if not os.path.isdir("/proc"):
+        return None
+    return sum(_rss_kb(p) for pid in pids for p in _descendants(pid)) / 1024
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class Sampler:
+    """Samples server memory and disk footprint in the background"""
+
+    def __init__(self, pids: list, workdir: str, interval: float = 0.5):
+        self.pids = pids
+        self.workdir = workdir
+        self.interval = interval
+        self.samples = []
+        # project files in /tmp left over from earlier runs are not ours
+        self.baseline = self._artifact_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _artifact_bytes() -> int:
+        return sum(group["bytes"] for group in scan_artifacts().values())
+
+    def sample(self) -> dict:
+        return {
+            "t": time.time(),
+            "rss_mb": tree_rss_mb(self.pids),
+            "artifact_bytes": max(0, self._artifact_bytes() - self.baseline),
+            # task database and caches live in the benchmark's work dir
+            "state_bytes": dir_size(self.workdir),
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append(self.sample())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(self.sample())
+
+
+# ─── Clients ───────────────────────────────────────────────────────────────────
+
+
+def run_task(session, base_url: str, video_id: str, args) -> dict:
+    """One client round trip: submit, long-poll until finished, download"""
+    result = {"video_id": video_id, "status": "failed", "rejections": 0}
+    started = time.perf_counter()
+
+    while True:
+        response = session.post(
+            f"{base_url}/process",
+            json={
+                "url": f"https://youtu.be/{video_id}",
+                "use_cache": not args.no_cache,
+            },
+        )
+        if response.status_code in (429, 503):
+            result["rejections"] += 1
+            time.sleep(float(response.headers.get("Retry-After", 1)))
+            continue
+        break
+    if response.status_code != 200:
+        result["error"] = f"submit: {response.status_code} {response.text[:200]}"
+        return result
+    task_id = response.json()["task_id"]
+    result["task_id"] = task_id
+    result["submit"] = time.perf_counter() - started
+
+    etag = None
+    while True:
+        headers = {"If-None-Match": etag} if etag else {}
+        response = session.get(
+            f"{base_url}/status/{task_id}", params={"wait": 30}, headers=headers
+        )
+        if response.status_code == 304:
+            continue
+        if response.status_code != 200:
+            result["error"] = f"status: {response.status_code}"
+            return result
+        status = response.json()
+        if status["status"] not in ("pending", "processing"):
+            break
+        etag = response.headers.get("ETag")
+        if not etag:
+            time.sleep(0.5)
+    result["status"] = status["status"]
+    result["processed"] = time.perf_counter() - started
+    result["timings"] = status.get("timings") or {}
+    if status["status"] != "completed":
+        result["error"] = status.get("error") or status.get("message")
+        return result
+
+    download_started = time.perf_counter()
+    response = session.get(f"{base_url}/download/{task_id}", stream=True)
+    size = sum(len(chunk) for chunk in response.iter_content(65536))
+    if response.status_code != 200:
+        result["status"] = "failed"
+        result["error"] = f"download: {response.status_code}"
+        return result
+    result["download"] = time.perf_counter() - download_started
+    result["download_bytes"] = size
+    result["end_to_end"] = time.perf_counter() - started
+    return result
+
+
+def run_clients(base_url: str, video_ids: list, args) -> list:
+    results = []
+    lock = threading.Lock()
+    pending = iter(enumerate(video_ids))
+
+    def client(number):
+        session = requests.Session()
+        session.headers["X-Forwarded-For"] = f"10.0.{number // 256}.{number % 256}"
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            index, video_id = item
+            try:
+                result = run_task(session, base_url, video_id, args)
+            except requests.RequestException as e:
+                result = {"video_id": video_id, "status": "failed", "error": str(e)}
+            with lock:
+                results.append(result)
+                if result["status"] != "completed":
+                    log(f"❌ {video_id}: {result.get('error')}")
+                elif len(results) % max(1, len(video_ids) // 10) == 0:
+                    log(f"📊 {len(results)}/{len(video_ids)} tasks done")
+
+    threads = [
+        threading.Thread(target=client, args=(i,)) for i in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_flood(base_url: str, video_ids: list, args, report: dict):
+    """
+    One abusive client: submits all its videos back to back without waiting
+    for results (retrying rejections after at most a second), then waits
+    for its tasks to finish. Fills report as it goes.
+    """
+    session = requests.Session()
+    session.headers["X-Forwarded-For"] = "10.255.255.1"
+    report.update(tasks=len(video_ids), rejections=0, task_ids=[])
+    started = time.perf_counter()
+    for video_id in video_ids:
+        while True:
+            response = session.post(
+                f"{base_url}/process",
+                json={"url": f"https://youtu.be/{video_id}"},
+            )
+            if response.status_code not in (429, 503):
+                break
+            report["rejections"] += 1
+            time.sleep(min(1.0, float(response.headers.get("Retry-After", 1))))
+        if response.status_code == 200:
+            report["task_ids"].append(response.json()["task_id"])
+    report["submit_seconds"] = round(time.perf_counter() - started, 3)
+
+    statuses = {}
+    for task_id in report["task_ids"]:
+        while True:
+            status = session.get(f"{base_url}/status/{task_id}").json()["status"]
+            if status not in ("pending", "processing"):
+                break
+            time.sleep(0.5)
+        statuses[status] = statuses.get(status, 0) + 1
+    report["statuses"] = statuses
+    report["seconds"] = round(time.perf_counter() - started, 3)
+
+
+# ─── Report ────────────────────────────────────────────────────────────────────
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def rank(p):
+        return values[
+            min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+        ]
+
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(rank(50), 4),
+        "p95": round(rank(95), 4),
+        "p99": round(rank(99), 4),
+        "max": round(values[-1], 4),
+    }
+
+
+def summarize(results: list, samples: list, wall: float, upstreams: dict) -> dict:
+    completed = [r for r in results if r["status"] == "completed"]
+
+    # Per-task totals of each stage (a task may call Gemini several times)
+    per_stage = {}
+    for result in results:
+        totals = {}
+        for span in result.get("timings", {}).get("stages", []):
+            totals[span["name"]] = totals.get(span["name"], 0) + span["duration"]
+        for name, duration in totals.items():
+            per_stage.setdefault(name, []).append(duration)
+
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    disk = [(s["artifact_bytes"] + s["state_bytes"]) / 2**20 for s in samples]
+    return {
+        "tasks": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "rejections": sum(r.get("rejections", 0) for r in results),
+        "wall_seconds": round(wall, 3),
+        "tasks_per_sec": round(len(completed) / wall, 3) if wall else 0,
+        "latency": {
+            name: percentiles([r[name] for r in completed if name in r])
+            for name in ("submit", "processed", "download", "end_to_end")
+        },
+        "stages": {name: percentiles(values) for name, values in per_stage.items()},
+        "download_bytes": percentiles([r["download_bytes"] for r in completed]),
+        "memory": {
+            "start_rss_mb": round(rss[0], 1) if rss else None,
+            "peak_rss_mb": round(max(rss), 1) if rss else None,
+            "end_rss_mb": round(rss[-1], 1) if rss else None,
+        },
+        "disk": {
+            "peak_mb": round(max(disk), 2) if disk else 0,
+            "end_mb": round(disk[-1], 2) if disk else 0,
+            "peak_artifact_mb": round(
+                max((s["artifact_bytes"] for s in samples), default=0) / 2**20, 2
+            ),
+        },
+        "upstreams": upstreams,
+    }
+
+
+def print_summary(summary: dict):
+    log("\n" + "=" * 60)
+    log(
+        f"✅ {summary['completed']}/{summary['tasks']} tasks completed in "
+        f"{summary['wall_seconds']}s ({summary['tasks_per_sec']} tasks/sec), "
+        f"{summary['rejections']} submissions rejected"
+    )
+    log(f"\n{'':<20}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    rows = [(name, p) for name, p in summary["latency"].items()]
+    rows += [(f"  {name}", p) for name, p in sorted(summary["stages"].items())]
+    for name, p in rows:
+        if p:
+            log(
+                f"{name:<20}{p['p50']:>10.3f}{p['p95']:>10.3f}"
+                f"{p['p99']:>10.3f}{p['max']:>10.3f}"
+            )
+    memory, disk = summary["memory"], summary["disk"]
+    log(
+        f"\n🧠 RSS: {memory['start_rss_mb']} MB at start, "
+        f"{memory['peak_rss_mb']} MB peak, {memory['end_rss_mb']} MB at end"
+    )
+    log(
+        f"💾 Disk: {disk['peak_mb']} MB peak ({disk['peak_artifact_mb']} MB "
+        f"project files), {disk['end_mb']} MB at end"
+    )
+    for name, stats in summary["upstreams"].items():
+        log(
+            f"🌐 {name}: {stats['requests']} requests, {stats['errors']} errors, "
+            f"{stats['rate_limited']} rate limited"
+        )
+    flood = summary.get("flood")
+    if flood:
+        log(
+            f"🌊 Flood: {flood['tasks']} tasks submitted in {flood['submit_seconds']}s "
+            f"({flood['rejections']} rejections), finished after {flood['seconds']}s: "
+            f"{flood['statuses']}"
+        )
+
+
+def lookup(data: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def print_comparison(previous: dict, current: dict):
+    log(f"\n🔍 Compared with {previous.get('label') or previous.get('started_at')}")
+    log(f"{'':<28}{'before':>12}{'after':>12}{'change':>10}")
+    for path, lower_is_better in COMPARED:
+        before = lookup(previous["summary"], path)
+        after = lookup(current["summary"], path)
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        better = (after < before) == lower_is_better and after != before
+        marker = " ✅" if better else (" ⚠️" if after != before else "")
+        log(f"{path:<28}{before:>12}{after:>12}{change:>10}{marker}")
+
+
+# ─── Main ──────────────────────────────────────────────────────────────────────
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load-test the API against local fake notegpt and Gemini servers"
+    )
+    load = parser.add_argument_group("load")
+    load.add_argument("-n", "--tasks", type=int, default=50, help="Tasks to submit")
+    load.add_argument("-c", "--clients", type=int, default=8, help="Concurrent clients")
+    load.add_argument(
+        "--videos",
+        type=int,
+        default=0,
+        help="Distinct videos among the tasks (default: all distinct, so caches miss)",
+    )
+    load.add_argument(
+        "--flood",
+        type=int,
+        default=0,
+        metavar="N",
+        help="One more client submits N tasks at once, to measure fairness",
+    )
+    load.add_argument(
+        "--no-cache", action="store_true", help="Submit with use_cache=false"
+    )
+
+    upstream = parser.add_argument_group("fake upstreams")
+    upstream.add_argument("--notegpt-latency", type=float, default=0.3, help="Seconds")
+    upstream.add_argument("--gemini-latency", type=float, default=2.0, help="Seconds")
+    upstream.add_argument(
+        "--jitter",
+        type=float,
+        default=0.25,
+        help="Latency spread as a fraction of the mean",
+    )
+    upstream.add_argument("--notegpt-error-rate", type=float, default=0.0)
+    upstream.add_argument("--notegpt-429-rate", type=float, default=0.0)
+    upstream.add_argument("--gemini-error-rate", type=float, default=0.0)
+    upstream.add_argument("--gemini-429-rate", type=float, default=0.0)
+    upstream.add_argument(
+        "--transcript-kb", type=float, default=20, help="Transcript size"
+    )
+    upstream.add_argument(
+        "--files", type=int, default=10, help="Files per generated project"
+    )
+    upstream.add_argument(
+        "--file-kb", type=float, default=4, help="Size of each generated file"
+    )
+
+    server = parser.add_argument_group("API server")
+    server.add_argument("--keys", type=int, default=4, help="Fake Gemini keys")
+    server.add_argument(
+        "--key-rpm", type=float, default=100000, help="GEMINI_KEY_RPM for the fake keys"
+    )
+    server.add_argument(
+        "-e",
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Extra environment for the server, e.g. -e WORKER_MODE=process",
+    )
+    server.add_argument(
+        "--queue-workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Run the API with WORKER_MODE=queue and N worker.py processes",
+    )
+    server.add_argument(
+        "--keep", action="store_true", help="Keep tasks and files afterwards"
+    )
+
+    output = parser.add_argument_group("results")
+    output.add_argument(
+        "--label", default="", help="Name of this run in the results file"
+    )
+    output.add_argument("--results-dir", default="bench_results")
+    output.add_argument(
+        "--compare", metavar="FILE", help="Earlier results file to compare with"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {
+        "transcript_kb": args.transcript_kb,
+        "manifest_text": fake_manifest_text(args.files, args.file_kb),
+    }
+    notegpt = FakeUpstream(
+        args.notegpt_latency,
+        args.jitter,
+        args.notegpt_error_rate,
+        args.notegpt_429_rate,
+    )
+    gemini = FakeUpstream(
+        args.gemini_latency, args.jitter, args.gemini_error_rate, args.gemini_429_rate
+    )
+    notegpt_server = start_server(make_handler("Notegpt", notegpt, config))
+    gemini_server = start_server(make_handler("Gemini", gemini, config))
+
+    workdir = tempfile.mkdtemp(prefix="y2p_bench_")
+    log(f"🚀 Starting API server (state in {workdir})")
+    processes, base_url = start_api(
+        args,
+        workdir,
+        f"http://127.0.0.1:{notegpt_server.server_port}/api/v2/video-transcript",
+        f"http://127.0.0.1:{gemini_server.server_port}",
+    )
+
+    distinct = args.videos or args.tasks
+    pool = [
+        "".join(random.choice(ID_CHARS) for _ in range(11)) for _ in range(distinct)
+    ]
+    video_ids = [pool[i % distinct] for i in range(args.tasks)]
+    random.shuffle(video_ids)
+
+    sampler = Sampler([p.pid for p in processes], workdir)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    try:
+        sampler.start()
+        log(f"🏁 {args.tasks} tasks from {args.clients} clients against {base_url}")
+        flood = {}
+        if args.flood:
+            flood_ids = [
+                "".join(random.choice(ID_CHARS) for _ in range(11))
+                for _ in range(args.flood)
+            ]
+            flood_thread = threading.Thread(
+                target=run_flood, args=(base_url, flood_ids, args, flood)
+            )
+            flood_thread.start()
+            log(f"🌊 Flooding with {args.flood} tasks from one more client")
+        started = time.perf_counter()
+        results = run_clients(base_url, video_ids, args)
+        wall = time.perf_counter() - started
+        if args.flood:
+            flood_thread.join()
+        sampler.stop()
+
+        if not args.keep:
+            task_ids = [r["task_id"] for r in results if r.get("task_id")]
+            for task_id in task_ids + flood.get("task_ids", []):
+                requests.delete(f"{base_url}/tasks/{task_id}")
+    finally:
+        stop_processes(processes)
+        notegpt_server.shutdown()
+        gemini_server.shutdown()
+
+    summary = summarize(
+        results,
+        sampler.samples,
+        wall,
+        {"notegpt": notegpt.stats, "gemini": gemini.stats},
+    )
+    if flood:
+        summary["flood"] = {k: v for k, v in flood.items() if k != "task_ids"}
+    print_summary(summary)
+
+    options = vars(args).copy()
+    options.pop("compare")
+    report = {
+        "label": args.label,
+        "started_at": started_at,
+        "options": options,
+        "summary": summary,
+        "tasks": results,
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    name = datetime.now().strftime("%Y%m%d-%H%M%S")
+    if args.label:
+        name += f"-{args.label}"
+    path = os.path.join(args.results_dir, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    log(f"\n📄 Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+    if args.keep:
+        log(f"📁 Server state kept in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,228 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
 from services.download_transcript import get_youtube_transcript as transcript
+from services.extract_youtube_id import extract_id
 from services.generate_manifest import (
     generate_manifest_from_transcript as generate_manifest,
 )
 from services.scaffold_project import scaffold
 
+_print_lock = threading.Lock()
+
+
+def log(message: str):
+    with _print_lock:
+        print(message, flush=True)
+
+
+def read_urls(sources) -> list:
+    """
+    Collect URLs from the command line arguments.
+
+    Each source is a URL, a text file with one URL per line, or "-" for
+    stdin. Blank lines and lines starting with "#" are ignored.
+    """
+    urls = []
+    for source in sources:
+        if source == "-":
+            lines = sys.stdin.read().splitlines()
+        elif os.path.isfile(source):
+            with open(source, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        else:
+            lines = [source]
+        urls.extend(
+            line.strip()
+            for line in lines
+            if line.strip() and not line.strip().startswith("#")
+        )
+    return urls
+
+
+def zip_path(output_dir: str, video_id: str) -> str:
+    return os.path.join(output_dir, f"{video_id}_project.zip")
+
+
+def process_url(url: str, output_dir: str, use_cache=True, expand=False) -> dict:
+    """Run the transcript -> manifest -> scaffold pipeline for one URL"""
+    video_id = extract_id(url)
+    result = {"url": url, "video_id": video_id, "status": "failed", "timings": {}}
+    timings = result["timings"]
+    started = time.perf_counter()
+    stage_start = started
+
+    def lap(stage):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[stage] = round(now - stage_start, 2)
+        stage_start = now
+
+    try:
+        # Step 1: Get transcript
+        transcription = transcript(url, use_cache=use_cache)
+        if not transcription:
+            raise Exception("Failed to get transcription")
+        lap("transcript")
+
+        # Step 2: Generate manifest
+        manifest_info = {}
+        manifest = generate_manifest(
+            transcription, use_cache=use_cache, run_info=manifest_info
+        )
+        if not manifest:
+            raise Exception("Failed to generate manifest")
+        lap("manifest")
+
+        # Step 3: Create project scaffold
+        scaffold(manifest, task_id=video_id, expand=expand, out_dir=output_dir)
+        lap("scaffold")
+
+        result.update(
+            status="completed",
+            files=len(manifest["files"]),
+            cache=manifest_info.get("cache"),
+            output=zip_path(output_dir, video_id),
+        )
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def print_summary(results: list, elapsed: float):
+    log("\n📊 Batch summary")
+    for r in results:
+        stages = ", ".join(f"{k} {v}s" for k, v in r.get("timings", {}).items())
+        if r["status"] == "completed":
+            log(f"  ✅ {r['video_id']}: {r['files']} files in {r['seconds']}s ({stages})")
+        elif r["status"] == "skipped":
+            log(f"  ⏭️  {r['video_id']}: already done")
+        else:
+            log(f"  ❌ {r['video_id']}: {r['error']} ({r['seconds']}s)")
+
+    counts = {
+        status: sum(1 for r in results if r["status"] == status)
+        for status in ("completed", "skipped", "failed")
+    }
+    log(
+        f"\n{counts['completed']} completed, {counts['skipped']} skipped, "
+        f"{counts['failed']} failed in {elapsed:.1f}s"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Turn YouTube tutorials into project scaffolds."
+    )
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        help='URLs or files with one URL per line ("-" reads stdin)',
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+        help="videos processed at the same time (default: WORKER_CONCURRENCY or 4)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="output",
+        help="where project zips and the report are written (default: output)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="reprocess videos whose zip already exists in the output directory",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="bypass the transcript and manifest caches",
+    )
+    parser.add_argument(
+        "--expand",
+        action="store_true",
+        help="also write each project's directory tree next to its zip",
+    )
+    args = parser.parse_intermixed_args(argv)
+
+    sources = args.sources
+    if not sources:
+        if sys.stdin.isatty():
+            sources = [str(input("put video URL : "))]
+        else:
+            sources = ["-"]
+
+    # One job per video, even if it is listed under several URL forms
+    jobs = {}
+    for url in read_urls(sources):
+        jobs.setdefault(extract_id(url), url)
+    if not jobs:
+        parser.error("no URLs given")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = []
+    pending = []
+    for video_id, url in jobs.items():
+        if not args.no_resume and os.path.exists(zip_path(args.output_dir, video_id)):
+            results.append({"url": url, "video_id": video_id, "status": "skipped"})
+        else:
+            pending.append(url)
 
-def main():
-    # raw video transcript
-    youtube_url = str(input("put vedio URL : "))
-    transcription = transcript(youtube_url)
-    print("transcription ok:", transcription)
+    log(
+        f"🚀 {len(pending)} videos to process "
+        f"({len(results)} already done), {args.jobs} at a time"
+    )
+    started = time.perf_counter()
+    # Threads share the process-wide Gemini key pool, which enforces the
+    # per-key rate limits across all jobs
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [
+            executor.submit(
+                process_url,
+                url,
+                args.output_dir,
+                use_cache=not args.no_cache,
+                expand=args.expand,
+            )
+            for url in pending
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["status"] == "completed":
+                log(f"✅ {result['video_id']} done in {result['seconds']}s")
+            else:
+                log(f"❌ {result['video_id']} failed: {result['error']}")
+    elapsed = time.perf_counter() - started
 
-    # generate manifest from transcript
-    manifest = generate_manifest()
-    print("manifest ok:", manifest)
+    print_summary(results, elapsed)
+    report_path = os.path.join(args.output_dir, "batch_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "finished_at": datetime.now().isoformat(),
+                "seconds": round(elapsed, 2),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    log(f"📝 Report saved to {report_path}")
 
-    # scaffold project
-    scaffold(manifest=manifest)
+    return 1 if any(r["status"] == "failed" for r in results) else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
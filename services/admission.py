@@ -0,0 +1,73 @@
+import math
+import threading
+import time
+
+from .key_pool import TokenBucket
+
+
+class Rejected(Exception):
+    """A submission turned away; the client may try again after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class Admission:
+    """
+    Per-client quotas for new submissions.
+
+    Each client has a token bucket of `rate` submissions per minute (bursts
+    up to the same number) and may have at most `max_active` tasks pending
+    or processing at once; active_count(client) tells how many it has.
+    A limit of 0 disables that check. Buckets live in this process.
+    """
+
+    # Buckets kept before full (idle) ones are dropped
+    MAX_CLIENTS = 10000
+
+    def __init__(self, rate: float, max_active: int, active_count):
+        self.rate = rate
+        self.max_active = max_active
+        self.active_count = active_count
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def check(self, client: str, task_seconds: float):
+        """
+        Take one submission from client's quota, or raise Rejected.
+
+        task_seconds (a typical task's duration) is used to suggest when a
+        client at its active limit should come back.
+        """
+        if self.max_active:
+            active = self.active_count(client)
+            if active >= self.max_active:
+                raise Rejected(
+                    f"Too many tasks in progress ({active}); "
+                    "wait for one to finish before submitting more",
+                    task_seconds,
+                    "active",
+                )
+        if self.rate:
+            with self._lock:
+                now = time.monotonic()
+                bucket = self._buckets.get(client)
+                if bucket is None:
+                    if len(self._buckets) >= self.MAX_CLIENTS:
+                        self._prune(now)
+                    bucket = self._buckets[client] = TokenBucket(self.rate)
+                wait = bucket.wait_time(1, now)
+                if wait > 0:
+                    raise Rejected(
+                        f"Rate limit of {self.rate:g} submissions per minute exceeded",
+                        wait,
+                        "rate",
+                    )
+                bucket.consume(1, now)
+
+    def _prune(self, now: float):
+        for client, bucket in list(self._buckets.items()):
+            if bucket.wait_time(bucket.capacity, now) == 0:
+                del self._buckets[client]
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TieredCache:
+    """
+    Two-tier cache: a bounded in-memory LRU in front of an on-disk store.
+
+    Values must be JSON-serializable. Entries older than ttl seconds are
+    treated as misses in both tiers. When max_disk_bytes is set, the least
+    recently used disk entries are evicted to stay under it. Safe to share
+    between threads; the disk tier may be shared between processes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 256,
+        ttl: float = 86400,
+        cache_dir: str = None,
+        max_disk_bytes: int = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, key: str):
+        """Return the cached value, or None on a miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if not self._expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+        entry = self._disk_get(key)
+        with self._lock:
+            # Checked again: the entry may have aged out while being read
+            if entry is None or self._expired(entry[1]):
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            self.hits += 1
+            self.disk_hits += 1
+            # Promoted with its original write time, so the TTL keeps counting
+            self._remember(key, value, stored_at)
+        return value
+
+    def set(self, key: str, value):
+        """Store a value in both tiers"""
+        with self._lock:
+            self._remember(key, value, time.time())
+        self._disk_set(key, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _remember(self, key, value, stored_at):
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        """(value, stored_at) from disk, stored_at being the file's mtime"""
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            if self.max_disk_bytes:
+                # Refresh access time (only) so LRU eviction keeps hot entries
+                os.utime(path, (time.time(), stored_at))
+            return value, stored_at
+        except (OSError, ValueError):
+            return None
+
+    def _disk_set(self, key, value):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Failed to write {self.name} cache entry: {e}")
+            return
+        if self.max_disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Drop least recently used disk entries until under max_disk_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
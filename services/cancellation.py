@@ -0,0 +1,116 @@
+import threading
+from contextlib import contextmanager
+
+
+class TaskCancelled(Exception):
+    """Raised inside a job whose task was cancelled (e.g. deleted)"""
+
+
+class CancelToken:
+    """
+    Cancellation flag of one running job, checked by the pipeline between
+    and inside its stages.
+
+    cancel() may be called from any thread. Code blocked in a call (an HTTP
+    request, a Gemini response, a wait for an API key) registers a callback
+    with on_cancel() so it is woken up at once instead of at the next check.
+    A job in another process is cancelled through watch(), which polls a
+    predicate (e.g. "the task is gone from the store") in the background.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._watcher = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Cancel callback failed: {e}")
+
+    def check(self):
+        """Raise TaskCancelled if the task was cancelled"""
+        if self._event.is_set():
+            raise TaskCancelled("Task was cancelled")
+
+    def wait(self, seconds: float):
+        """Sleep for seconds, raising TaskCancelled as soon as it is cancelled"""
+        if self._event.wait(seconds):
+            raise TaskCancelled("Task was cancelled")
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """Run callback on cancel() while the block runs (at once if already cancelled)"""
+        with self._lock:
+            registered = not self._event.is_set()
+            if registered:
+                self._callbacks.append(callback)
+        if not registered:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run a blocking call that cannot be interrupted in a helper thread
+        and return its result, or raise TaskCancelled as soon as the task is
+        cancelled. The abandoned call finishes in the background and its
+        result is dropped.
+        """
+        self.check()
+        done = threading.Event()
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            done.set()
+
+        threading.Thread(target=target, name="cancellable-call", daemon=True).start()
+        with self.on_cancel(done.set):
+            done.wait()
+        if "result" in outcome:
+            return outcome["result"]
+        if "error" in outcome:
+            raise outcome["error"]
+        raise TaskCancelled("Task was cancelled")
+
+    def watch(self, is_cancelled, interval: float = 1.0):
+        """Cancel once is_cancelled() returns True, polled every interval seconds"""
+        stop = threading.Event()
+
+        def poll():
+            while not stop.wait(interval):
+                try:
+                    if is_cancelled():
+                        self.cancel()
+                        return
+                except Exception as e:
+                    print(f"⚠️ Cancellation check failed: {e}")
+
+        self._watcher = stop
+        threading.Thread(target=poll, name="cancel-watch", daemon=True).start()
+
+    def close(self):
+        """Stop the watch() thread once the job is over"""
+        if self._watcher is not None:
+            self._watcher.set()
+            self._watcher = None
@@ -1,75 +1,290 @@
-import requests
+import asyncio
+import threading
+from concurrent.futures import CancelledError
+
+import httpx
 
 # from urllib.parse import urlparse
 import os
+from dotenv import load_dotenv
+from .cache import TieredCache
+from .cancellation import TaskCancelled
 from .extract_youtube_id import extract_id
+from .metrics import RETRIES
+from .resilience import (
+    RETRY_MAX_DELAY,
+    CircuitOpen,
+    backoff_delay,
+    get_breaker,
+    parse_retry_after,
+)
+from .tracing import stage
 
+load_dotenv()
 
-def get_youtube_transcript(youtube_url):
-    # Extract video ID from YouTube URL
-    # video_id = urlparse(youtube_url).path.split("/")[-1]
-    video_id = extract_id(youtube_url)
+# Transcripts keyed by canonical video ID: in-memory LRU + on-disk tier with TTL
+transcript_cache = TieredCache(
+    "transcript",
+    max_entries=int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("TRANSCRIPT_CACHE_TTL", "86400")),
+    cache_dir=os.path.join(os.getenv("CACHE_DIR", "/tmp/y2p_cache"), "transcripts"),
+)
+
+# API endpoint
+NOTEGPT_API_URL = os.getenv(
+    "NOTEGPT_API_URL", "https://notegpt.io/api/v2/video-transcript"
+)
+CONNECT_TIMEOUT = float(os.getenv("NOTEGPT_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("NOTEGPT_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("NOTEGPT_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.getenv("NOTEGPT_RETRY_BASE_DELAY", "0.5"))
+MAX_CONNECTIONS = int(os.getenv("NOTEGPT_MAX_CONNECTIONS", "20"))
+
+# Headers from the observed request (Host, Connection and Accept-Encoding
+# are left to the HTTP client so pooling and decompression work)
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:139.0) Gecko/20100101 Firefox/139.0",
+    "Accept": "*/*",
+    "Accept-Language": "fr,fr-FR;q=0.8,en-US;q=0.5,en;q=0.3",
+    "Referer": "https://notegpt.io/youtube-transcript-generator",
+    "Cookie": (
+        "sbox-guid=MTczMTUxNjAyM3w2MDV8OTQ3Njg3MTgw; "
+        "_uab_collina=173151604203402789730031; "
+        "_ga_PFX3BRW5RQ=GS1.1.1731606121.2.0.1731606121.60.0.825030076; "
+        "_ga=GA1.2.147912956.1731516043; "
+        "_trackUserId=G-1748946840000; "
+        'g_state={"i_p":1752328996077,"i_l":4}; '
+        "anonymous_user_id=677f88e861288a014e8350dd62e0f7da; "
+        "is_first_visit=true; "
+        "crisp-client%2Fsession%2F02aa9b53-fc37-4ca7-954d-7a99fb3393de=session_f7989467-2361-4bb6-9284-4197c29d7fe5; "
+        "crisp-client%2Fsocket%2F02aa9b53-fc37-4ca7-954d-7a99fb3393de=0"
+    ),
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin",
+    "TE": "trailers",
+    "Priority": "u=0",
+}
+
+
+class TranscriptError(Exception):
+    """Base class for transcript failures"""
+
+
+class TranscriptFetchError(TranscriptError):
+    """The provider could not be reached or kept failing after retries"""
+
+
+class TranscriptUnavailable(TranscriptError):
+    """The provider answered, but has no transcript for this video"""
+
+
+class _HTTPClient:
+    """
+    Long-lived pooled AsyncClient running on its own event loop thread.
+
+    Worker threads share it through run(), so connections to the provider
+    are reused across tasks. Recreated lazily after a fork.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._pid = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="transcript-http", daemon=True
+            )
+            thread.start()
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                timeout=httpx.Timeout(
+                    READ_TIMEOUT, connect=CONNECT_TIMEOUT, read=READ_TIMEOUT
+                ),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                ),
+            )
+            self._loop = loop
+            self._pid = os.getpid()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        self._ensure_started()
+        return self._client
 
-    # API endpoint and parameters
-    api_url = "https://notegpt.io/api/v2/video-transcript"
+    def run(self, coro, cancel=None):
+        """
+        Run a coroutine on the client's loop and wait for its result.
+        Cancelling the CancelToken cancel aborts it (requests in flight too)
+        and raises TaskCancelled.
+        """
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        if cancel is None:
+            return future.result()
+        try:
+            with cancel.on_cancel(future.cancel):
+                return future.result()
+        except CancelledError:
+            raise TaskCancelled("Task was cancelled")
+
+    def close(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop, client = self._loop, self._client
+            self._loop = self._client = None
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+http_client = _HTTPClient()
+
+
+async def fetch_transcript(video_id: str, run_info: dict = None) -> str:
+    """
+    Fetch a transcript from notegpt with the pooled client.
+
+    Network errors, 429 and 5xx responses are retried up to MAX_RETRIES
+    times (counted in run_info["retries"]) with jittered exponential
+    backoff, waiting at least as long as a Retry-After header asks. They
+    also count against the notegpt circuit breaker: while it is open,
+    CircuitOpen is raised without a request. Otherwise raises
+    TranscriptFetchError or TranscriptUnavailable.
+    """
+    if run_info is None:
+        run_info = {}
     params = {"platform": "youtube", "video_id": video_id}
+    breaker = get_breaker("notegpt")
+    last_error = None
+    retry_after = None
+
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            RETRIES.inc(stage="transcript")
+            run_info["retries"] = attempt
+            await asyncio.sleep(
+                backoff_delay(attempt, RETRY_BASE_DELAY, retry_after=retry_after)
+            )
+        while True:
+            try:
+                breaker.before_call()
+                break
+            except CircuitOpen as e:
+                if not e.probing:
+                    raise
+                await asyncio.sleep(e.retry_after)  # another fetch is probing
+        try:
+            response = await http_client.client.get(NOTEGPT_API_URL, params=params)
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            last_error = f"{type(e).__name__}: {e}"
+            retry_after = None
+            print(f"⚠️ Transcript request failed (attempt {attempt + 1}): {last_error}")
+            continue
 
-    # Headers from the observed request
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:139.0) Gecko/20100101 Firefox/139.0",
-        "Accept": "*/*",
-        "Accept-Language": "fr,fr-FR;q=0.8,en-US;q=0.5,en;q=0.3",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
-        "Referer": "https://notegpt.io/youtube-transcript-generator",
-        "Connection": "keep-alive",
-        "Cookie": (
-            "sbox-guid=MTczMTUxNjAyM3w2MDV8OTQ3Njg3MTgw; "
-            "_uab_collina=173151604203402789730031; "
-            "_ga_PFX3BRW5RQ=GS1.1.1731606121.2.0.1731606121.60.0.825030076; "
-            "_ga=GA1.2.147912956.1731516043; "
-            "_trackUserId=G-1748946840000; "
-            'g_state={"i_p":1752328996077,"i_l":4}; '
-            "anonymous_user_id=677f88e861288a014e8350dd62e0f7da; "
-            "is_first_visit=true; "
-            "crisp-client%2Fsession%2F02aa9b53-fc37-4ca7-954d-7a99fb3393de=session_f7989467-2361-4bb6-9284-4197c29d7fe5; "
-            "crisp-client%2Fsocket%2F02aa9b53-fc37-4ca7-954d-7a99fb3393de=0"
-        ),
-        "Host": "notegpt.io",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin",
-        "TE": "trailers",
-        "Priority": "u=0",
-    }
-
-    # Make the API request
-    response = requests.get(api_url, params=params, headers=headers)
-
-    if response.status_code == 200:
-        data = response.json()
-        # print(data)
+        if response.status_code == 429 or response.status_code >= 500:
+            breaker.record_failure()
+            last_error = f"Request failed with status: {response.status_code}"
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            print(f"⚠️ {last_error} (attempt {attempt + 1})")
+            if retry_after is not None and retry_after > RETRY_MAX_DELAY:
+                raise TranscriptFetchError(
+                    f"{last_error}, provider asks to retry in {retry_after:.0f}s"
+                )
+            continue
+        breaker.record_success()
+        if response.status_code != 200:
+            raise TranscriptFetchError(
+                f"Request failed with status: {response.status_code}"
+            )
+
+        try:
+            data = response.json()
+        except ValueError:
+            raise TranscriptFetchError("Transcript provider returned invalid JSON")
 
         # Extract and format the transcript
-        if data.get("code") == 100000:  # success code
-            transcripts = data["data"]["transcripts"]
-            lang = next(iter(transcripts))  # get first language
+        if data.get("code") != 100000:  # success code
+            raise TranscriptUnavailable(f"Error: {data.get('message')}")
+
+        transcripts = data["data"]["transcripts"]
+        if not transcripts:
+            raise TranscriptUnavailable("No transcript available for this video")
+        lang = next(iter(transcripts))  # get first language
+
+        # Combine all text segments, one per line so chunking can split at
+        # segment boundaries
+        full_transcript = "\n".join(
+            segment["text"] for segment in transcripts[lang]["custom"]
+        ).strip()
+        if not full_transcript:
+            raise TranscriptUnavailable("Transcript is empty")
+        return full_transcript
+
+    raise TranscriptFetchError(
+        f"Transcript provider failed after {MAX_RETRIES + 1} attempts: {last_error}"
+    )
+
+
+def get_youtube_transcript(
+    youtube_url,
+    save_to: str = None,
+    use_cache: bool = True,
+    run_info: dict = None,
+    cancel=None,
+):
+    """
+    Fetch the transcript of a YouTube video and return it as a string.
+
+    The transcript is kept in memory; pass save_to to also persist it
+    (e.g. a per-task path such as /tmp/{task_id}_transcript.txt).
+    Set use_cache=False to bypass the transcript cache for this call.
+    run_info, if given, receives "cache": "hit", "miss" or "bypass", the
+    number of "retries" made and the timed "spans" of the fetch.
+    cancel, a CancelToken, aborts the request (and its retries) when cancelled.
+
+    Raises:
+        TranscriptError: If the transcript cannot be fetched
+        CircuitOpen: If notegpt has been failing and is not called for now
+    """
+    if run_info is None:
+        run_info = {}
+    # Extract video ID from YouTube URL
+    # video_id = urlparse(youtube_url).path.split("/")[-1]
+    video_id = extract_id(youtube_url)
 
-            # Combine all text segments
-            full_transcript = ""
-            for segment in transcripts[lang]["custom"]:
-                full_transcript += segment["text"] + " "
+    full_transcript = transcript_cache.get(video_id) if use_cache else None
+    run_info["cache"] = "bypass" if not use_cache else "miss"
+    if full_transcript is not None:
+        print(f"⚡ Transcript cache hit for {video_id}")
+        run_info["cache"] = "hit"
+        _save_transcript(full_transcript, save_to)
+        return full_transcript
 
-            # FIXED: Use /tmp instead of output directory
-            file_path_transcript = "/tmp/transcript.txt"
+    # Make the API request on the shared, pooled client
+    with stage("transcript_fetch", run_info, video_id=video_id) as span:
+        full_transcript = http_client.run(
+            fetch_transcript(video_id, run_info), cancel=cancel
+        )
+        span["chars"] = len(full_transcript)
+    transcript_cache.set(video_id, full_transcript)
 
-            # Ensure the /tmp directory exists (it should, but just in case)
-            os.makedirs(os.path.dirname(file_path_transcript), exist_ok=True)
+    _save_transcript(full_transcript, save_to)
+    return full_transcript
 
-            with open(file_path_transcript, "w") as file:
-                file.write(full_transcript.strip())
 
-            return full_transcript.strip()
-        else:
-            return f"Error: {data.get('message')}"
-    else:
-        return f"Request failed with status: {response.status_code}"
+def _save_transcript(full_transcript: str, save_to: str = None):
+    """Optional per-task persistence"""
+    if save_to:
+        os.makedirs(os.path.dirname(save_to) or ".", exist_ok=True)
+        with open(save_to, "w") as file:
+            file.write(full_transcript)
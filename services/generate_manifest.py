@@ -1,252 +1,787 @@
 import re
 import os
 import json
+import hashlib
+import threading
 import google.generativeai as genai
 from dotenv import load_dotenv
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as google_exceptions
+
+from .cache import TieredCache
+from .cancellation import TaskCancelled
+from .key_pool import NoKeyAvailable, get_key_pool
+from .json_repair import TRUNCATION_REPAIRS, extract_json
+from .manifest_stream import ManifestStreamParser
+from .metrics import RETRIES
+from .resilience import (
+    RETRY_MAX_DELAY,
+    CircuitOpen,
+    backoff_delay,
+    get_breaker,
+    parse_retry_after,
+)
+from .tracing import stage
 
 
-# FIXED: Use /tmp instead of relative paths
-file_path_transcript = "/tmp/transcript.txt"
-file_path_manifest = "/tmp/manifest.json"
-
 # ─── Load env vars ─────────────────────────────────────────────────────────────
 load_dotenv()
 
+MODEL_NAME = "gemini-2.0-flash"  # Use full flash model
+
+# Set MANIFEST_STRUCTURED_OUTPUT=1 to have the model return JSON constrained
+# by MANIFEST_SCHEMA instead of free text. The schema language has no map
+# type, so files come back as a list of {"path", "content"} objects.
+STRUCTURED_OUTPUT = os.getenv("MANIFEST_STRUCTURED_OUTPUT", "0") == "1"
+MANIFEST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "folders": {"type": "array", "items": {"type": "string"}},
+        "files": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string"},
+                    "content": {"type": "string"},
+                },
+                "required": ["path", "content"],
+            },
+        },
+    },
+    "required": ["folders", "files"],
+}
+
+GENERATION_CONFIG = {
+    "temperature": float(os.getenv("MANIFEST_TEMPERATURE", "1")),
+    "max_output_tokens": 8192,
+    "top_p": 0.95,
+}
+if STRUCTURED_OUTPUT:
+    GENERATION_CONFIG["response_mime_type"] = "application/json"
+    GENERATION_CONFIG["response_schema"] = MANIFEST_SCHEMA
+
+# Map-reduce mode for long transcripts: transcripts estimated above this many
+# tokens are split into chunks of at most this size (0 disables chunking)
+CHUNK_TOKENS = int(os.getenv("MANIFEST_CHUNK_TOKENS", "0"))
+MAP_CONCURRENCY = int(os.getenv("MANIFEST_MAP_CONCURRENCY", "4"))
+
+# Cut-off responses are completed with up to this many continuation requests
+MAX_CONTINUATIONS = int(os.getenv("MANIFEST_MAX_CONTINUATIONS", "3"))
+
+# Gemini results keyed by a hash of (prompt, model, generation config)
+manifest_cache = TieredCache(
+    "manifest",
+    max_entries=int(os.getenv("MANIFEST_CACHE_SIZE", "128")),
+    ttl=float(os.getenv("MANIFEST_CACHE_TTL", "604800")),
+    cache_dir=os.path.join(os.getenv("CACHE_DIR", "/tmp/y2p_cache"), "manifests"),
+    max_disk_bytes=int(float(os.getenv("MANIFEST_CACHE_MAX_MB", "256")) * 1024 * 1024),
+)
+
+
+def build_prompt(transcript: str, part: int = None, parts: int = None) -> str:
+    """Build the manifest generation prompt for a transcript (or one part of it)"""
+    if parts and parts > 1:
+        scope = f"""
+        This is part {part} of {parts} of the transcript. Only include the folders
+        and files that are created or changed in this part, each file with its
+        full contents as of the end of this part.
+        """
+    else:
+        scope = ""
 
-class APIKeyManager:
-    """Manages multiple API keys with rotation and fallback logic"""
-
-    def __init__(self, api_keys_string: str):
-        """Initialize with semicolon-separated API keys"""
-        self.api_keys = [
-            key.strip() for key in api_keys_string.split(";") if key.strip()
+    if STRUCTURED_OUTPUT:
+        shape = """{
+        "folders": [ "relative/path/to/folder", ... ],
+        "files": [
+            { "path": "relative/path/to/file.py", "content": "full contents of that file" },
+            ...
         ]
-        self.current_key_index = 0
-        self.failed_keys = set()
+        }"""
+    else:
+        shape = """{
+        "folders": [ "relative/path/to/folder", ... ],
+        "files": {
+            "relative/path/to/file.py": "full contents of that file",
+            ...
+        }
+        }"""
 
-        if not self.api_keys:
-            raise ValueError("No valid API keys found in the configuration")
+    # Use more explicit prompt similar to AI Studio
+    return f"""
+        You are given the transcript of a tutorial video that walks through building
+        a structured project (folders, Python files, or java files, or any programming language, text files, etc.) and shows all code snippets.
+        {scope}
+        Output **only** a single valid JSON object (no markdown, no prose) with exactly these keys:
 
-        print(f"✅ Loaded {len(self.api_keys)} API keys")
+        {shape}
 
-    def get_next_key(self) -> str:
-        """Get the next available API key"""
-        available_keys = [
-            key for i, key in enumerate(self.api_keys) if i not in self.failed_keys
-        ]
+        Transcript:
+        \"\"\"
+        {transcript}
+        \"\"\"
+
+        Now output the JSON manifest **and nothing else**:
+        """
 
-        if not available_keys:
-            raise Exception("All API keys have been exhausted")
 
-        # Use round-robin selection from available keys
-        key_index = self.current_key_index % len(available_keys)
-        selected_key = available_keys[key_index]
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (~4 characters per token), no API call"""
+    return len(text) // 4 + 1
+
+
+def split_transcript(transcript: str, max_tokens: int) -> list:
+    """
+    Split a transcript into chunks of at most max_tokens (estimated),
+    cutting at segment boundaries (one segment per line).
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for segment in transcript.split("\n"):
+        pieces = [segment]
+        if estimate_tokens(segment) > max_tokens:
+            # A single oversized segment is cut at word boundaries
+            words = segment.split(" ")
+            step = max(1, len(words) * max_tokens // estimate_tokens(segment))
+            pieces = [" ".join(words[i : i + step]) for i in range(0, len(words), step)]
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def merge_manifests(partials: list) -> dict:
+    """
+    Merge partial manifests in transcript order: folders are unioned (first
+    appearance order) and the latest version of each file wins.
+    """
+    folders = {}
+    files = {}
+    for partial in partials:
+        for folder in partial["folders"]:
+            folders.setdefault(folder, None)
+        for path, content in partial["files"].items():
+            files[path] = content
+    return {"folders": list(folders), "files": files}
 
-        # Find the original index of this key
-        original_index = self.api_keys.index(selected_key)
 
-        self.current_key_index = (self.current_key_index + 1) % len(available_keys)
+def manifest_cache_key(prompt: str, model_name: str, generation_config: dict) -> str:
+    """Content address of a generation request (the transcript is part of the prompt)"""
+    payload = json.dumps(
+        {
+            "prompt": prompt,
+            "model": model_name,
+            "generation_config": generation_config,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-        return selected_key, original_index
 
-    def mark_key_failed(self, key_index: int, error: str):
-        """Mark an API key as failed"""
-        self.failed_keys.add(key_index)
-        print(f"❌ API key #{key_index + 1} failed: {error}")
-        print(f"📊 Remaining keys: {len(self.api_keys) - len(self.failed_keys)}")
+def _is_quota_error(error: Exception) -> bool:
+    return isinstance(error, google_exceptions.ResourceExhausted) or "429" in str(error)
 
-    def has_available_keys(self) -> bool:
-        """Check if there are still available keys"""
-        return len(self.failed_keys) < len(self.api_keys)
+
+def _is_invalid_key_error(error: Exception) -> bool:
+    return isinstance(
+        error, (google_exceptions.PermissionDenied, google_exceptions.Unauthenticated)
+    ) or "API key not valid" in str(error)
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Gemini itself failed (5xx, timeout, unreachable): counts for the breaker"""
+    # requests' network errors (REST transport) are OSErrors too
+    return isinstance(error, (google_exceptions.ServerError, OSError))
+
+
+def classify_error(error: Exception) -> str:
+    """
+    How a failed Gemini call should be retried:
+    "key" (this key is rejected) and "quota" (this key is rate limited) move
+    on to another key, "fatal" (the request itself is wrong, e.g. 400/404)
+    is not retried, "transient" (anything else) is retried after a backoff.
+    """
+    if _is_invalid_key_error(error):
+        return "key"
+    if _is_quota_error(error):
+        return "quota"
+    if isinstance(error, (google_exceptions.BadRequest, google_exceptions.NotFound)):
+        return "fatal"
+    return "transient"
+
+
+def retry_hint(error: Exception):
+    """
+    Seconds the server asked to wait before retrying, from a Retry-After
+    header or a google.rpc.RetryInfo detail (REST or gRPC), or None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        hint = parse_retry_after(headers.get("Retry-After"))
+        if hint is not None:
+            return hint
+    for detail in getattr(error, "details", None) or ():
+        if isinstance(detail, dict):
+            delay = detail.get("retryDelay")  # REST: "12.5s"
+            if delay:
+                try:
+                    return float(str(delay).rstrip("s"))
+                except ValueError:
+                    continue
+        elif getattr(detail, "retry_delay", None) is not None:
+            delay = detail.retry_delay  # gRPC: RetryInfo with a Duration
+            return delay.seconds + delay.nanos / 1e9
+    return None
+
+
+def normalize_path(path: str) -> str:
+    """Fix common extension mistakes in generated file paths"""
+    new_path = re.sub(r"\.pi$", ".py", path)
+    new_path = re.sub(r"\.js$", ".js", new_path)  # Ensure proper case
+    return new_path
+
+
+def _chunk_text(chunk) -> str:
+    """Text of a streamed chunk (chunks carrying only metadata have none)"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _stream_response(
+    model, prompt: str, listener, restart: bool = True, cancel=None
+):
+    """
+    Generate with stream=True, passing manifest entries to the listener as
+    soon as they are complete. Returns (raw_text, response). restart=False
+    keeps what the listener already has (used for continuations). A
+    cancelled CancelToken stops the stream at the next chunk.
+    """
+    response = model.generate_content(prompt, stream=True)
+    parser = ManifestStreamParser()
+    if restart:
+        listener.start()
+    chunks = []
+    for chunk in response:
+        if cancel is not None:
+            cancel.check()
+        text = _chunk_text(chunk)
+        chunks.append(text)
+        for event in parser.feed(text):
+            if event[0] == "folder":
+                listener.folder(event[1])
+            else:
+                listener.file(normalize_path(event[1]), event[2])
+    return "".join(chunks), response
+
+
+def parse_manifest(raw_text: str, repairs: list = None, run_info: dict = None) -> dict:
+    """
+    Extract, validate and normalize the manifest JSON from a model response
+
+    Common LLM JSON mistakes are fixed locally (see services/json_repair.py);
+    pass a list as repairs to receive what was fixed. The time spent is
+    recorded as a "json_extract" span in run_info, if given.
+
+    Raises:
+        ValueError: If no valid manifest can be extracted, or the response
+            was cut off (its complete entries are left to _partial_manifest)
+    """
+    if not raw_text or raw_text.strip() == "":
+        raise ValueError("Empty response from API")
+
+    with stage("json_extract", run_info, chars=len(raw_text)):
+        # Structured output is plain JSON: skip extraction and repair entirely
+        if STRUCTURED_OUTPUT:
+            try:
+                return validate_manifest(json.loads(raw_text))
+            except ValueError:
+                pass
+
+        # Single-pass tolerant extraction (fences, trailing commas, control chars...)
+        manifest, applied = extract_json(raw_text)
+        cut_off = [repair for repair in applied if repair in TRUNCATION_REPAIRS]
+        if cut_off:
+            # Closing it would keep a half-written last file
+            raise ValueError(f"Response was cut off ({', '.join(cut_off)})")
+        if repairs is not None:
+            repairs.extend(applied)
+        return validate_manifest(manifest)
+
+
+def validate_manifest(manifest) -> dict:
+    """
+    Check the manifest structure and normalize it to
+    {"folders": [...], "files": {path: content}}
+
+    Raises:
+        ValueError: If the structure is not a valid manifest
+    """
+    # Validate manifest structure
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest is not a valid dictionary")
+
+    if "folders" not in manifest or "files" not in manifest:
+        raise ValueError("Manifest missing required 'folders' or 'files' keys")
+
+    # Structured output lists files as [{"path": ..., "content": ...}]
+    if isinstance(manifest["files"], list):
+        try:
+            manifest["files"] = {
+                entry["path"]: entry["content"] for entry in manifest["files"]
+            }
+        except (KeyError, TypeError):
+            raise ValueError("Manifest 'files' entries need 'path' and 'content'")
+
+    if not isinstance(manifest["files"], dict) or not all(
+        isinstance(content, str) for content in manifest["files"].values()
+    ):
+        raise ValueError("Manifest 'files' must map paths to file contents")
+
+    # Normalize file extensions
+    files = manifest.get("files", {})
+    normalized_files = {}
+    for path, content in files.items():
+        normalized_files[normalize_path(path)] = content
+    manifest["files"] = normalized_files
+    return manifest
 
 
 def generate_manifest_from_transcript(
-    transcript_path: str = file_path_transcript,
-    output_path: str = file_path_manifest,
+    transcript: str = None,
+    transcript_path: str = None,
+    output_path: str = None,
     max_retries_per_key: int = 2,
     retry_delay: float = 1.0,
+    use_cache: bool = True,
+    run_info: dict = None,
+    listener=None,
+    cancel=None,
 ) -> dict:
     """
-    Generate manifest from transcript using multiple API keys with fallback
+    Generate manifest from transcript using the shared API key pool
 
     Args:
-        transcript_path: Path to transcript file
-        output_path: Path to save manifest JSON
-        max_retries_per_key: Maximum retries per API key before marking as failed
+        transcript: Transcript text (preferred, avoids a disk round-trip)
+        transcript_path: Path to a transcript file, used when transcript is None
+        output_path: Optional path to also save the manifest JSON
+        max_retries_per_key: Attempts allowed per API key in the pool
         retry_delay: Delay between retries in seconds
+        use_cache: Look up / store the result in the manifest cache
+        run_info: Optional dict filled with details about this run
+            ("cache": "hit", "miss" or "bypass", "chunks" when split,
+            "repairs" when the model's JSON had to be fixed, "retries",
+            and the timed "spans" of every Gemini call and parse)
+        listener: Optional object with start(), folder(path) and
+            file(path, content) methods. When given, the response is
+            streamed and each entry is passed on as soon as it is complete;
+            start() is called at the beginning of every attempt. Not used
+            when a long transcript is split into chunks.
+        cancel: Optional CancelToken; cancelling it aborts the Gemini calls
+            in flight, the waits for a key and between retries
 
     Returns:
         dict: Generated manifest
 
     Raises:
+        TaskCancelled: If cancel was cancelled
         Exception: If all API keys fail or no valid response is generated
     """
 
-    # Get API keys from environment
-    api_keys_string = os.getenv("GEMINI_API_KEY")
-    if not api_keys_string:
-        raise ValueError("GEMINI_API_KEY environment variable not found")
+    if run_info is None:
+        run_info = {}
+
+    # Read transcript from disk only when it was not passed in memory
+    if transcript is None:
+        if transcript_path is None:
+            raise ValueError("Either transcript or transcript_path is required")
+        with open(transcript_path, "r") as f:
+            transcript = f.read()
+
+    print(f"📝 Transcript length: {len(transcript)} characters")
+
+    chunks = [transcript]
+    if CHUNK_TOKENS and estimate_tokens(transcript) > CHUNK_TOKENS:
+        chunks = split_transcript(transcript, CHUNK_TOKENS)
+    if len(chunks) > 1:
+        prompts = [
+            build_prompt(chunk, part=i + 1, parts=len(chunks))
+            for i, chunk in enumerate(chunks)
+        ]
+    else:
+        prompts = [build_prompt(transcript)]
+
+    # Identical inputs produce a cached manifest without any LLM call
+    cache_key = manifest_cache_key("".join(prompts), MODEL_NAME, GENERATION_CONFIG)
+    if use_cache:
+        manifest = manifest_cache.get(cache_key)
+        if manifest is not None:
+            print("⚡ Manifest cache hit")
+            run_info["cache"] = "hit"
+            _save_manifest(manifest, output_path)
+            return manifest
+        run_info["cache"] = "miss"
+    else:
+        run_info["cache"] = "bypass"
+
+    # Long transcripts: map over chunks in parallel, then merge
+    if len(prompts) > 1:
+        print(f"🧩 Splitting transcript into {len(prompts)} chunks")
+        run_info["chunks"] = len(prompts)
+        with ThreadPoolExecutor(max_workers=max(1, MAP_CONCURRENCY)) as executor:
+            partials = list(
+                executor.map(
+                    lambda chunk: _generate_manifest(
+                        prompts[chunk],
+                        max_retries_per_key,
+                        retry_delay,
+                        run_info=run_info,
+                        chunk=chunk + 1,
+                        cancel=cancel,
+                    ),
+                    range(len(prompts)),
+                )
+            )
+        manifest = merge_manifests(partials)
+    else:
+        manifest = _generate_manifest(
+            prompts[0],
+            max_retries_per_key,
+            retry_delay,
+            listener,
+            run_info,
+            cancel=cancel,
+        )
+
+    manifest_cache.set(cache_key, manifest)
+    _save_manifest(manifest, output_path)
+    return manifest
+
+
+def _generate_manifest(
+    prompt: str,
+    max_retries_per_key: int,
+    retry_delay: float,
+    listener=None,
+    run_info: dict = None,
+    chunk: int = None,
+    cancel=None,
+) -> dict:
+    """Run one prompt through Gemini with retries across the key pool"""
+    if run_info is None:
+        run_info = {}
+    # Shared, process-wide key pool (rate limits and cooldowns persist across calls)
+    key_pool = get_key_pool()
 
-    # Initialize API key manager
-    key_manager = APIKeyManager(api_keys_string)
+    max_attempts = max_retries_per_key * len(key_pool)
+    last_error = None
+    attempts = 0
 
-    # Read transcript
-    with open(transcript_path, "r") as f:
-        print("\n\n\nread text : ")
-        print("------------------------------------------")
-        transcript = f.read()
-        print(transcript)
+    for attempt in range(max_attempts):
+        attempts = attempt + 1
+        print(f"🔄 Attempt {attempt + 1}/{max_attempts}")
+        try:
+            raw_text, response, key = _call_model(
+                key_pool,
+                prompt,
+                listener,
+                run_info=run_info,
+                cancel=cancel,
+                attempt=attempt + 1,
+                chunk=chunk,
+            )
+        except (TaskCancelled, CircuitOpen):
+            raise
+        except NoKeyAvailable as e:
+            last_error = e
+            break
+        except Exception as attempt_error:
+            kind = classify_error(attempt_error)
+            print(f"⚠️ Attempt {attempt + 1} failed ({kind}): {attempt_error}")
+            last_error = attempt_error
+            if kind == "fatal":
+                break
+            if attempt < max_attempts - 1:
+                # Quota and key errors: the pool hands out another key (or
+                # waits for one), honoring the server's hint as a cooldown
+                delay = 0.0
+                if kind == "transient":
+                    hint = retry_hint(attempt_error)
+                    if hint is not None and hint > RETRY_MAX_DELAY:
+                        break
+                    delay = backoff_delay(attempt + 1, retry_delay, retry_after=hint)
+                _count_retry(run_info)
+                print(f"🔄 Retrying in {delay:.1f} seconds...")
+                _sleep(delay, cancel)
+            continue
 
-    # Use more explicit prompt similar to AI Studio
-    prompt = f"""
-        You are given the transcript of a tutorial video that walks through building
-        a structured project (folders, Python files, or java files, or any programming language, text files, etc.) and shows all code snippets.
-        Output **only** a single valid JSON object (no markdown, no prose) with exactly these keys:
+        # Improved JSON extraction
+        try:
+            if _is_truncated(response):
+                raise ValueError("Response was cut off at the output token limit")
+            repairs = []
+            manifest = parse_manifest(raw_text, repairs, run_info)
+            if repairs:
+                print(f"🩹 Repaired model JSON: {', '.join(repairs)}")
+                run_info.setdefault("repairs", []).extend(repairs)
+        except (ValueError, json.JSONDecodeError) as json_error:
+            # Cut-off output: keep the complete files and ask only for the rest
+            partial = _partial_manifest(raw_text)
+            if partial is not None:
+                try:
+                    manifest = _continue_manifest(
+                        key_pool, prompt, partial, listener, run_info, chunk, cancel
+                    )
+                    print(f"✅ Successfully generated manifest with key {key.label}")
+                    return manifest
+                except TaskCancelled:
+                    raise
+                except Exception as continuation_error:
+                    json_error = continuation_error
+
+            error_msg = f"JSON parsing failed: {json_error}"
+            print(f"⚠️ {error_msg}")
+            print("Raw response preview:")
+            print(raw_text[:500] + "..." if raw_text and len(raw_text) > 500 else raw_text)
+            last_error = Exception(error_msg)
+            if attempt < max_attempts - 1:
+                _count_retry(run_info)
+                delay = backoff_delay(attempt + 1, retry_delay)
+                print(f"🔄 Retrying in {delay:.1f} seconds...")
+                _sleep(delay, cancel)
+            continue
 
-        {{
-        "folders": [ "relative/path/to/folder", ... ],
-        "files": {{
-            "relative/path/to/file.py": "full contents of that file",
-            ...
-        }}
-        }}
+        print(f"✅ Successfully generated manifest with key {key.label}")
+        return manifest
 
-        Transcript:
-        \"\"\"
-        {transcript}
-        \"\"\"
+    # If we get here, every attempt has failed
+    error_message = f"Manifest generation failed after {attempts} attempts across {len(key_pool)} API keys. Last error: {last_error}"
+    print(f"💥 {error_message}")
+    raise Exception(error_message)
 
-        Now output the JSON manifest **and nothing else**:
-        """
 
-    # Try each API key until one works
-    last_error = None
+def _count_retry(run_info: dict):
+    RETRIES.inc(stage="gemini")
+    run_info["retries"] = run_info.get("retries", 0) + 1
 
-    while key_manager.has_available_keys():
-        try:
-            # Get next available API key
-            api_key, key_index = key_manager.get_next_key()
-            print(f"🔑 Trying API key #{key_index + 1}...")
 
-            # Configure Gemini with current API key
-            genai.configure(api_key=api_key)
+def _sleep(seconds: float, cancel=None):
+    """time.sleep that a CancelToken cuts short"""
+    if cancel is None:
+        time.sleep(seconds)
+    else:
+        cancel.wait(seconds)
+
 
-            # Set up model with specific parameters
+def _call_model(
+    key_pool,
+    prompt: str,
+    listener=None,
+    restart: bool = True,
+    run_info: dict = None,
+    cancel=None,
+    **span_attrs,
+):
+    """
+    One Gemini call on a key from the pool. Returns (raw_text, response, key);
+    the key is released with its real token usage or the error it hit.
+    The call is recorded as a "gemini_generate" span in run_info, if given,
+    with the key used, the time spent waiting for it and the token counts.
+
+    When cancel (a CancelToken) is cancelled, the wait for a key or the call
+    is abandoned at once and TaskCancelled is raised. An abandoned call keeps
+    running in the background and holds its key until it ends: the key is
+    then released with the call's real usage, or with the whole estimate
+    charged if a cancelled stream was cut short.
+
+    Raises CircuitOpen without calling while the Gemini breaker is open;
+    provider failures count against it, any answer from Gemini resets it.
+    """
+    breaker = get_breaker("gemini")
+    probe = breaker.admit(cancel.wait if cancel is not None else time.sleep)
+    estimated_tokens = estimate_tokens(prompt) + GENERATION_CONFIG["max_output_tokens"]
+    waited = time.perf_counter()
+    try:
+        key = key_pool.acquire(estimated_tokens, cancel=cancel)
+    except BaseException:
+        if probe:
+            breaker.abandon_probe()
+        raise
+    print(f"🔑 Using API key {key.label}")
+    span_attrs = {k: v for k, v in span_attrs.items() if v is not None}
+    span_attrs.update(key=key.label, key_wait=round(time.perf_counter() - waited, 4))
+    if listener is not None:
+        generate = _stream_response
+        args = (listener, restart, cancel)
+    else:
+        generate = _generate_text
+        args = ()
+    # Taken by whichever side releases the key: the call if it starts, else
+    # the caller when cancelled before that
+    owner = threading.Lock()
+
+    def call():
+        # Runs the request and releases the key, even once abandoned by cancel
+        if not owner.acquire(blocking=False):
+            raise TaskCancelled("Task was cancelled")
+        try:
+            # Model bound to this key's own client (no global genai.configure)
             model = genai.GenerativeModel(
-                model_name="gemini-2.0-flash",  # Use full flash model
-                generation_config={
-                    "temperature": 1,
-                    "max_output_tokens": 8192,
-                    "top_p": 0.95,
-                },
+                model_name=MODEL_NAME,
+                generation_config=GENERATION_CONFIG,
+            )
+            model._client = key.client
+            raw_text, response = generate(model, prompt, *args)
+        except TaskCancelled:
+            # Stream stopped part-way, its usage unknown: keep the estimate.
+            # Gemini was answering, so the breaker still gets a verdict
+            breaker.record_success()
+            key_pool.release(key, estimated_tokens)
+            raise
+        except Exception as e:
+            # Every call ends with a verdict, or a half-open probe would hold
+            # back all Gemini calls until it times out
+            if _is_provider_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()  # Gemini answered (quota, bad request...)
+            key_pool.release(
+                key,
+                estimated_tokens,
+                error=str(e),
+                quota=_is_quota_error(e),
+                invalid=_is_invalid_key_error(e),
+                retry_after=retry_hint(e),
             )
+            raise
+        usage = getattr(response, "usage_metadata", None)
+        breaker.record_success()
+        key_pool.release(
+            key,
+            estimated_tokens,
+            tokens_used=getattr(usage, "total_token_count", None) or None,
+        )
+        return raw_text, response
+
+    try:
+        with stage("gemini_generate", run_info, **span_attrs) as span:
+            if cancel is not None:
+                raw_text, response = cancel.call(call)
+            else:
+                raw_text, response = call()
+            usage = getattr(response, "usage_metadata", None)
+            span["prompt_tokens"] = getattr(usage, "prompt_token_count", None)
+            span["output_tokens"] = getattr(usage, "candidates_token_count", None)
+    except TaskCancelled:
+        if owner.acquire(blocking=False):
+            # Cancelled before the request was sent: nothing was used
+            key_pool.release(key, estimated_tokens, tokens_used=0)
+            if probe:
+                breaker.abandon_probe()
+        raise
+    return raw_text, response, key
+
+
+def _generate_text(model, prompt: str):
+    """Non-streamed generation; returns (raw_text, response)"""
+    response = model.generate_content(prompt)
+    return response.text, response
+
+
+def _is_truncated(response) -> bool:
+    """True when the model stopped because it hit max_output_tokens"""
+    try:
+        finish_reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return False
+    return getattr(finish_reason, "name", finish_reason) in ("MAX_TOKENS", 2)
+
+
+def _partial_manifest(raw_text: str):
+    """
+    The complete entries of a cut-off manifest, or None if the text is not
+    an unfinished manifest (or holds no complete file to build on).
+    """
+    if not raw_text:
+        return None
+    parser = ManifestStreamParser()
+    parser.feed(raw_text)
+    if parser.done or not parser.files:
+        return None
+    return {
+        "folders": parser.folders,
+        "files": {normalize_path(path): content for path, content in parser.files.items()},
+    }
+
+
+def build_continuation_prompt(prompt: str, partial: dict) -> str:
+    """Ask for the files that are still missing from a cut-off manifest"""
+    done = "\n".join(f"        - {path}" for path in partial["files"])
+    return f"""{prompt}
+
+        Your previous answer was cut off because it was too long. These files
+        are already complete and must NOT be repeated:
+{done}
+
+        Output **only** a JSON object with the same "folders" and "files" keys,
+        containing just the remaining files (and any folders not yet listed):
+        """
 
-            # Try the current key with retries
-            for attempt in range(max_retries_per_key):
-                try:
-                    print(
-                        f"🔄 Attempt {attempt + 1}/{max_retries_per_key} with key #{key_index + 1}"
-                    )
 
-                    # Generate content
-                    response = model.generate_content(prompt)
-                    raw_text = response.text
-
-                    if not raw_text or raw_text.strip() == "":
-                        raise Exception("Empty response from API")
-
-                    # Improved JSON extraction
-                    try:
-                        # Find first { and last } to capture JSON
-                        json_start = raw_text.find("{")
-                        json_end = raw_text.rfind("}") + 1
-
-                        if json_start == -1 or json_end <= json_start:
-                            raise ValueError(
-                                "No valid JSON structure found in response"
-                            )
-
-                        manifest_text = raw_text[json_start:json_end]
-
-                        # Handle markdown code fences
-                        manifest_text = re.sub(
-                            r"^```(json)?|```$", "", manifest_text, flags=re.MULTILINE
-                        )
-                        manifest = json.loads(manifest_text.strip())
-
-                        # Validate manifest structure
-                        if not isinstance(manifest, dict):
-                            raise ValueError("Manifest is not a valid dictionary")
-
-                        if "folders" not in manifest or "files" not in manifest:
-                            raise ValueError(
-                                "Manifest missing required 'folders' or 'files' keys"
-                            )
-
-                        print(
-                            f"✅ Successfully generated manifest with key #{key_index + 1}"
-                        )
-
-                        # Normalize file extensions
-                        files = manifest.get("files", {})
-                        normalized_files = {}
-                        for path, content in files.items():
-                            # Fix common extension mistakes
-                            new_path = re.sub(r"\.pi$", ".py", path)
-                            new_path = re.sub(
-                                r"\.js$", ".js", new_path
-                            )  # Ensure proper case
-                            normalized_files[new_path] = content
-                        manifest["files"] = normalized_files
-
-                        # Save to file
-                        with open(output_path, "w", encoding="utf-8") as f:
-                            json.dump(manifest, f, indent=2, ensure_ascii=False)
-
-                        print(f"✅ Manifest saved to {output_path}")
-                        return manifest
-
-                    except (ValueError, json.JSONDecodeError) as json_error:
-                        error_msg = f"JSON parsing failed: {json_error}"
-                        print(f"⚠️ {error_msg}")
-                        print("Raw response preview:")
-                        print(
-                            raw_text[:500] + "..." if len(raw_text) > 500 else raw_text
-                        )
-
-                        if attempt == max_retries_per_key - 1:
-                            raise Exception(error_msg)
-                        else:
-                            print(f"🔄 Retrying in {retry_delay} seconds...")
-                            time.sleep(retry_delay)
-                            continue
-
-                except Exception as attempt_error:
-                    error_msg = str(attempt_error)
-                    print(f"⚠️ Attempt {attempt + 1} failed: {error_msg}")
-
-                    if attempt == max_retries_per_key - 1:
-                        # Mark this key as failed after all retries
-                        key_manager.mark_key_failed(key_index, error_msg)
-                        last_error = attempt_error
-                        break
-                    else:
-                        print(f"🔄 Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-
-                        # Add some randomization to avoid rate limiting
-                        time.sleep(random.uniform(0.5, 1.5))
-
-        except Exception as key_error:
-            # This key failed completely
-            error_msg = str(key_error)
-            key_manager.mark_key_failed(key_index, error_msg)
-            last_error = key_error
+def _continue_manifest(
+    key_pool,
+    prompt: str,
+    partial: dict,
+    listener=None,
+    run_info: dict = None,
+    chunk: int = None,
+    cancel=None,
+) -> dict:
+    """Stitch continuation responses onto a cut-off manifest"""
+    manifest = partial
+    for continuation in range(MAX_CONTINUATIONS):
+        print(
+            f"✂️ Output truncated after {len(manifest['files'])} files, "
+            f"requesting continuation {continuation + 1}/{MAX_CONTINUATIONS}"
+        )
+        raw_text, response, _ = _call_model(
+            key_pool,
+            build_continuation_prompt(prompt, manifest),
+            listener,
+            restart=False,
+            run_info=run_info,
+            cancel=cancel,
+            continuation=continuation + 1,
+            chunk=chunk,
+        )
+        try:
+            if _is_truncated(response):
+                raise ValueError("Continuation was cut off")
+            tail = parse_manifest(raw_text, run_info=run_info)
+        except (ValueError, json.JSONDecodeError):
+            tail = _partial_manifest(raw_text)
+            if tail is None:
+                raise
+            manifest = merge_manifests([manifest, tail])
             continue
+        return merge_manifests([manifest, tail])
+    raise ValueError(f"Manifest still incomplete after {MAX_CONTINUATIONS} continuations")
 
-    # If we get here, all keys have failed
-    error_message = f"All {len(key_manager.api_keys)} API keys have been exhausted. Last error: {last_error}"
-    print(f"💥 {error_message}")
-    raise Exception(error_message)
+
+def _save_manifest(manifest: dict, output_path: str = None):
+    """Optional per-task persistence"""
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        print(f"✅ Manifest saved to {output_path}")
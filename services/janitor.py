@@ -0,0 +1,262 @@
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .task_store import FINISHED_STATUSES
+
+# Files a task leaves in the artifact directory, named after its task_id
+ARTIFACT_PATTERN = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_"
+    r"(project\.zip|project\.zip\.tmp|project|transcript\.txt|manifest\.json)$"
+)
+
+
+def _path_size(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def remove_artifacts(artifact_id: str, artifact_dir: str = "/tmp") -> int:
+    """Delete every file of an artifact; returns the number of bytes freed"""
+    freed = 0
+    for suffix in (
+        "project.zip",
+        "project.zip.tmp",
+        "project",
+        "transcript.txt",
+        "manifest.json",
+    ):
+        path = os.path.join(artifact_dir, f"{artifact_id}_{suffix}")
+        if not os.path.exists(path):
+            continue
+        size = _path_size(path)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass  # removed concurrently (another worker's janitor)
+    return freed
+
+
+def scan_artifacts(artifact_dir: str = "/tmp") -> dict:
+    """
+    Task artifacts on disk, grouped by artifact_id.
+
+    Returns {artifact_id: {"bytes": total size, "last_used": newest mtime}}.
+    """
+    groups = {}
+    try:
+        entries = list(os.scandir(artifact_dir))
+    except FileNotFoundError:
+        return groups
+    for entry in entries:
+        match = ARTIFACT_PATTERN.match(entry.name)
+        if not match:
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        group = groups.setdefault(match.group(1), {"bytes": 0, "last_used": 0.0})
+        group["bytes"] += _path_size(entry.path)
+        group["last_used"] = max(group["last_used"], mtime)
+    return groups
+
+
+class Janitor:
+    """
+    Background cleanup of finished tasks and their files.
+
+    Every `interval` seconds it:
+      0. fails tasks left in progress by an API process that went away
+         (their lease ran out, see SQLiteTaskStore);
+      1. deletes task records finished more than `retention` seconds ago,
+         together with artifacts no remaining task refers to;
+      2. removes orphaned artifacts (no task record at all);
+      3. if the artifacts still exceed `max_bytes`, evicts the least recently
+         used ones (downloads refresh a zip's mtime) and marks their tasks
+         as "expired".
+    Artifacts of tasks that are still running are never touched.
+    on_remove(artifact_id) is called for every artifact that goes away.
+    """
+
+    def __init__(
+        self,
+        tasks,
+        retention: float = 86400,
+        max_bytes: int = None,
+        interval: float = 60,
+        artifact_dir: str = "/tmp",
+        on_remove=None,
+    ):
+        self.tasks = tasks
+        self.retention = retention
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.artifact_dir = artifact_dir
+        self.on_remove = on_remove
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "tasks_expired": 0,
+            "tasks_interrupted": 0,
+            "artifacts_evicted": 0,
+            "bytes_freed": 0,
+            "footprint_bytes": 0,
+            "artifacts": 0,
+            "last_run": None,
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="janitor", daemon=True
+        )
+        self._thread.start()
+        print(
+            f"✅ Janitor started: retention {self.retention:.0f}s, "
+            f"disk budget {self._budget_label()}, every {self.interval:.0f}s"
+        )
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _budget_label(self) -> str:
+        if not self.max_bytes:
+            return "unlimited"
+        return f"{self.max_bytes / 2**20:.0f} MB"
+
+    def _run(self):
+        # First pass right away: cleans up after a restart
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Janitor sweep failed: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def _remove(self, artifact_id: str) -> int:
+        freed = remove_artifacts(artifact_id, self.artifact_dir)
+        if self.on_remove:
+            self.on_remove(artifact_id)
+        return freed
+
+    def sweep(self) -> dict:
+        """Run one cleanup pass; returns what it did"""
+        expired = evicted = freed = interrupted = 0
+
+        # 0. Tasks whose process died while running them
+        for task in self.tasks.interrupted():
+            self.tasks.update(
+                task["task_id"],
+                {
+                    "status": "failed",
+                    "message": "Failed to process video",
+                    "error": "Interrupted: the server processing this task stopped",
+                    "completed_at": datetime.now().isoformat(),
+                },
+            )
+            interrupted += 1
+
+        # 1. Task retention
+        if self.retention:
+            cutoff = (datetime.now() - timedelta(seconds=self.retention)).isoformat()
+            while True:
+                batch = self.tasks.finished_before(cutoff)
+                for task in batch:
+                    if self.tasks.delete(task["task_id"]) is None:
+                        continue
+                    expired += 1
+                    artifact_id = task.get("artifact_id") or task["task_id"]
+                    if not self.tasks.count(artifact_id=artifact_id):
+                        freed += self._remove(artifact_id)
+                if len(batch) < 500:
+                    break
+
+        # 2. Orphans (older than one interval, so a task being created is safe)
+        groups = scan_artifacts(self.artifact_dir)
+        now = time.time()
+        for artifact_id, group in list(groups.items()):
+            if now - group["last_used"] < self.interval:
+                continue
+            if not self.tasks.count(artifact_id=artifact_id):
+                freed += self._remove(artifact_id)
+                del groups[artifact_id]
+
+        # 3. Disk budget, least recently used first
+        footprint = sum(g["bytes"] for g in groups.values())
+        if self.max_bytes and footprint > self.max_bytes:
+            for artifact_id, group in sorted(
+                groups.items(), key=lambda item: item[1]["last_used"]
+            ):
+                if footprint <= self.max_bytes:
+                    break
+                referencing = self.tasks.with_artifact(artifact_id)
+                if any(t["status"] not in FINISHED_STATUSES for t in referencing):
+                    continue  # still being generated
+                freed += self._remove(artifact_id)
+                footprint -= group["bytes"]
+                del groups[artifact_id]
+                evicted += 1
+                for task in referencing:
+                    self.tasks.update(
+                        task["task_id"],
+                        {
+                            "status": "expired",
+                            "message": "Project files expired; submit the video again",
+                            "download_url": None,
+                        },
+                    )
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["tasks_expired"] += expired
+            self._stats["tasks_interrupted"] += interrupted
+            self._stats["artifacts_evicted"] += evicted
+            self._stats["bytes_freed"] += freed
+            self._stats["footprint_bytes"] = footprint
+            self._stats["artifacts"] = len(groups)
+            self._stats["last_run"] = datetime.now().isoformat()
+
+        if expired or evicted or freed or interrupted:
+            print(
+                f"🧹 Janitor: {interrupted} tasks interrupted, "
+                f"{expired} tasks expired, {evicted} artifacts evicted, "
+                f"{freed / 2**20:.1f} MB freed, footprint {footprint / 2**20:.1f} MB"
+            )
+        return {
+            "tasks_expired": expired,
+            "tasks_interrupted": interrupted,
+            "artifacts_evicted": evicted,
+            "bytes_freed": freed,
+            "footprint_bytes": footprint,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, max_bytes=self.max_bytes, retention=self.retention)
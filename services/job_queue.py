@@ -0,0 +1,218 @@
+import json
+import os
+import time
+
+from .sqlite_db import ThreadConnections, add_columns
+from .worker_pool import QueueFull
+
+
+class JobQueue:
+    """
+    Durable job queue in a SQLite database (WAL mode), shared by the API
+    processes that enqueue jobs and the worker processes that run them.
+
+    A claimed job is leased to its worker, which extends the lease while
+    the job runs; jobs whose lease runs out (the worker died) are handed to
+    the next worker that asks. Jobs carry a key (the video id): while one
+    is queued or running, putting another job with the same key returns
+    the first one's task_id instead, so duplicate submissions share it.
+
+    Jobs also record the client that submitted them; workers take the
+    oldest job of the client with the fewest running jobs, so a client with
+    a long backlog cannot hold every worker while others wait.
+    """
+
+    def __init__(self, path: str, lease: float = 60):
+        self.path = path
+        self.lease = lease
+        self._conn = ThreadConnections(path)
+        conn = self._conn()
+        with conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    task_id TEXT PRIMARY KEY,
+                    key TEXT,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state_enqueued
+                    ON jobs (state, enqueued_at);
+                CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key);
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    concurrency INTEGER NOT NULL,
+                    started_at REAL NOT NULL,
+                    seen_at REAL NOT NULL
+                );
+                """
+            )
+            # Queues created before fair dispatch have no client column
+            add_columns(conn, "jobs", {"client": "TEXT"})
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, state)"
+            )
+
+    def put(
+        self,
+        task_id: str,
+        payload: dict,
+        key: str = None,
+        max_queued: int = 0,
+        client: str = None,
+    ):
+        """
+        Enqueue a job for task_id on behalf of client.
+
+        Returns None, or the task_id of the queued/running job with the same
+        key (nothing is enqueued then). Raises QueueFull when max_queued jobs
+        are already waiting (0 = no limit).
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if key is not None:
+                row = conn.execute(
+                    "SELECT task_id FROM jobs WHERE key = ? LIMIT 1", (key,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return row[0]
+            if max_queued:
+                queued = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state = 'queued'"
+                ).fetchone()[0]
+                if queued >= max_queued:
+                    raise QueueFull(f"Job queue is full ({queued} waiting)")
+            conn.execute(
+                "INSERT INTO jobs (task_id, key, client, payload, state, enqueued_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?)",
+                (task_id, key, client, json.dumps(payload), time.time()),
+            )
+            conn.execute("COMMIT")
+            return None
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker_id: str):
+        """
+        Lease the next job to worker_id: the oldest one of the client with
+        the fewest running jobs.
+
+        Returns {"task_id", "payload", "attempts"} (attempts counts this
+        claim too), or None when there is nothing to do.
+        """
+        conn = self._conn()
+        now = time.time()
+        available = (
+            "SELECT task_id FROM jobs AS j WHERE state = 'queued' "
+            "OR (state = 'running' AND lease_until < :now) "
+            "ORDER BY (SELECT COUNT(*) FROM jobs AS r WHERE r.client IS j.client "
+            "AND r.state = 'running' AND r.lease_until >= :now), enqueued_at "
+            "LIMIT 1"
+        )
+        # Cheap read first, so idle workers polling never take the write lock
+        if conn.execute(
+            "SELECT 1 FROM jobs WHERE state = 'queued' "
+            "OR (state = 'running' AND lease_until < ?) LIMIT 1",
+            (now,),
+        ).fetchone() is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(available, {"now": now}).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE task_id = ?",
+                (worker_id, now + self.lease, row[0]),
+            )
+            job = conn.execute(
+                "SELECT task_id, payload, attempts FROM jobs WHERE task_id = ?",
+                (row[0],),
+            ).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {"task_id": job[0], "payload": json.loads(job[1]), "attempts": job[2]}
+
+    def done(self, task_id: str):
+        """Remove a finished job"""
+        self._conn().execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        Drop a job, queued or running (its worker finds the task gone and
+        stops); False if there was none. Its key is free again at once.
+        """
+        cursor = self._conn().execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+        return cursor.rowcount > 0
+
+    def heartbeat(self, worker_id: str, concurrency: int, task_ids=()):
+        """Extend the leases of worker_id's running jobs and mark it alive"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO workers (worker_id, concurrency, started_at, seen_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (worker_id) "
+                "DO UPDATE SET concurrency = excluded.concurrency, "
+                "seen_at = excluded.seen_at",
+                (worker_id, concurrency, now, now),
+            )
+            for task_id in task_ids:
+                conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE task_id = ? AND worker = ?",
+                    (now + self.lease, task_id, worker_id),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def leave(self, worker_id: str):
+        """Unregister a worker that is shutting down"""
+        self._conn().execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def stats(self) -> dict:
+        """
+        Queued and running jobs, clients with jobs waiting, and the workers
+        seen within one lease
+        """
+        conn = self._conn()
+        counts = dict(
+            conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        )
+        clients = conn.execute(
+            "SELECT COUNT(DISTINCT client) FROM jobs WHERE state = 'queued'"
+        ).fetchone()[0]
+        workers, capacity = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(concurrency), 0) FROM workers "
+            "WHERE seen_at > ?",
+            (time.time() - self.lease,),
+        ).fetchone()
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "clients": clients,
+            "workers": workers,
+            "capacity": capacity,
+        }
+
+
+def open_job_queue() -> JobQueue:
+    """
+    Job queue at JOB_DB_PATH (by default the task database, TASK_DB_PATH),
+    with leases of JOB_LEASE seconds.
+    """
+    path = os.getenv("JOB_DB_PATH") or os.getenv("TASK_DB_PATH", "/tmp/y2p_tasks.db")
+    return JobQueue(path, lease=float(os.getenv("JOB_LEASE", "60")))
@@ -0,0 +1,193 @@
+import json
+import re
+
+# Runs of ordinary string content (including valid escapes) and of text
+# between structural characters are copied in one slice
+_STRING_RUN = re.compile(r'(?:[^"\\\x00-\x1f]|\\["\\/bfnrtu])+')
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+# Repairs meaning the output was cut off: its last value may be unfinished
+TRUNCATION_REPAIRS = ("closed unterminated string", "closed unclosed brackets")
+# Markdown code fences (```json ... ```) are the normal wrapping, not a mistake
+_FENCE = re.compile(r"```[\w+-]*")
+
+
+def extract_json(raw_text: str):
+    """
+    Extract the first JSON object from LLM output in a single pass, fixing
+    the usual mistakes along the way.
+
+    Handles prose or code fences around the object, trailing commas, raw
+    control characters and invalid escapes inside strings, an unterminated
+    final string and unclosed brackets. The last two (TRUNCATION_REPAIRS)
+    only make cut-off output parse: its last value may be half-written.
+
+    Returns:
+        tuple: (parsed object, list of repairs that were applied)
+
+    Raises:
+        ValueError: If no JSON object can be recovered
+    """
+    start = raw_text.find("{")
+    if start == -1:
+        raise ValueError("No valid JSON structure found in response")
+
+    repairs = []
+    if _has_prose(raw_text[:start]):
+        repairs.append("stripped text before JSON")
+
+    # Fast path: well-formed output only needs the surrounding text cut off
+    stop = raw_text.rfind("}") + 1
+    try:
+        parsed = json.loads(raw_text[start:stop])
+        if _has_prose(raw_text[stop:]):
+            repairs.append("stripped text after JSON")
+        return parsed, repairs
+    except ValueError:
+        pass
+
+    out = []
+    stack = []
+    # Per open object: output index where the current member started
+    member_start = []
+    in_string = False
+    is_key = False
+    escape = False
+    i = start
+    end = len(raw_text)
+
+    while i < end:
+        ch = raw_text[i]
+
+        if in_string and not escape:
+            match = _STRING_RUN.match(raw_text, i)
+            if match:
+                out.append(match.group())
+                i = match.end()
+                continue
+
+        if not in_string:
+            match = _STRUCTURAL.search(raw_text, i)
+            stop = match.start() if match else end
+            if stop > i:
+                out.append(raw_text[i:stop])
+                i = stop
+                continue
+
+        if in_string:
+            if escape:
+                escape = False
+                if ch not in _VALID_ESCAPES:
+                    # Keep the backslash literally: "\x" -> "\\x"
+                    out.append("\\")
+                    _note(repairs, "escaped invalid escape sequences")
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == '"':
+                in_string = False
+                out.append(ch)
+            elif ch < " ":
+                out.append(_CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}"))
+                _note(repairs, "escaped control characters in strings")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            is_key = bool(stack) and stack[-1] == "{" and _expects_key(out)
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            if ch == "{":
+                member_start.append(len(out))
+            i += 1
+            continue
+        elif ch in "}]":
+            if not stack:
+                break
+            _drop_trailing_comma(out, repairs)
+            if stack.pop() == "{":
+                member_start.pop()
+            out.append(ch)
+            i += 1
+            if not stack:
+                break
+            continue
+        elif ch == "," and stack and stack[-1] == "{":
+            out.append(ch)
+            member_start[-1] = len(out)
+            i += 1
+            continue
+        out.append(ch)
+        i += 1
+
+    if _has_prose(raw_text[i:]) and not stack:
+        repairs.append("stripped text after JSON")
+
+    if stack:
+        # Output ended early: close what is open
+        if in_string:
+            if escape:
+                out.pop()
+            if is_key:
+                # A half-written key can't be kept; drop the whole member
+                del out[member_start[-1] :]
+            else:
+                out.append('"')
+                repairs.append("closed unterminated string")
+        if stack[-1] == "{" and _dangling_member(out, member_start[-1]):
+            del out[member_start[-1] :]
+        _drop_trailing_comma(out, repairs)
+        while stack:
+            out.append("}" if stack.pop() == "{" else "]")
+        repairs.append("closed unclosed brackets")
+
+    text = "".join(out)
+    try:
+        return json.loads(text), repairs
+    except json.JSONDecodeError as e:
+        applied = ", ".join(repairs) or "no repairs"
+        raise ValueError(f"Could not repair JSON ({applied}): {e}")
+
+
+def _has_prose(text: str) -> bool:
+    """True if text holds more than whitespace and code fences"""
+    return bool(_FENCE.sub("", text).strip())
+
+
+def _note(repairs, message):
+    if message not in repairs:
+        repairs.append(message)
+
+
+def _last_significant(out):
+    """(index, character) of the last non-whitespace output character"""
+    for j in range(len(out) - 1, -1, -1):
+        piece = out[j].rstrip()
+        if piece:
+            return j, piece[-1]
+    return -1, ""
+
+
+def _expects_key(out) -> bool:
+    return _last_significant(out)[1] in ("{", ",")
+
+
+def _drop_trailing_comma(out, repairs):
+    j, ch = _last_significant(out)
+    if ch == ",":
+        out[j] = out[j].rstrip()[:-1]
+        _note(repairs, "removed trailing commas")
+
+
+def _dangling_member(out, member_index) -> bool:
+    """True if the current object member is only a key (with or without ':')"""
+    member = "".join(out[member_index:]).strip()
+    return bool(member) and (
+        member.endswith(":") or (member.endswith('"') and ":" not in member)
+    )
@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Point the Gemini client at another endpoint (e.g. the fake server started
+# by benchmark.py); it then talks REST instead of gRPC, so http:// works
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+
+class NoKeyAvailable(Exception):
+    """Raised when no API key can serve a request (all disabled or busy too long)"""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill(now)
+        # Requests larger than the whole bucket only need a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+    def refund(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class APIKey:
+    """One API key with its rate limits, health and lazily created client"""
+
+    def __init__(self, index: int, key: str, rpm: float, tpm: float):
+        self.index = index
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.token_budget = TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.disabled = False
+        self.calls = 0
+        self.errors = 0
+        self.quota_errors = 0
+        self._client = None
+
+    @property
+    def label(self) -> str:
+        return f"#{self.index + 1}"
+
+    @property
+    def client(self):
+        """Gemini client bound to this key (no global genai.configure)"""
+        if self._client is None:
+            from google.ai import generativelanguage as glm
+
+            if GEMINI_API_ENDPOINT:
+                self._client = glm.GenerativeServiceClient(
+                    transport="rest",
+                    client_options={
+                        "api_key": self.key,
+                        "api_endpoint": GEMINI_API_ENDPOINT,
+                    },
+                )
+            else:
+                self._client = glm.GenerativeServiceClient(
+                    client_options={"api_key": self.key}
+                )
+        return self._client
+
+
+class KeyPool:
+    """
+    Process-wide, thread-safe pool of API keys.
+
+    Each key has token buckets for requests and tokens per minute. acquire()
+    picks the least-loaded key that has budget and is not cooling down,
+    waiting when every key is busy. Quota errors put a key into an
+    exponentially growing cooldown instead of dropping it; a success
+    resets it. Keys rejected as invalid are disabled for good.
+    """
+
+    def __init__(
+        self,
+        api_keys,
+        rpm: float = 15,
+        tpm: float = 1_000_000,
+        cooldown: float = 30,
+        max_cooldown: float = 600,
+    ):
+        if not api_keys:
+            raise ValueError("No valid API keys found in the configuration")
+        self.keys = [APIKey(i, key, rpm, tpm) for i, key in enumerate(api_keys)]
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._cond = threading.Condition()
+        print(f"✅ Loaded {len(self.keys)} API keys")
+
+    @classmethod
+    def from_env(cls):
+        """Build the pool from semicolon-separated keys in GEMINI_API_KEY"""
+        api_keys_string = os.getenv("GEMINI_API_KEY")
+        if not api_keys_string:
+            raise ValueError("GEMINI_API_KEY environment variable not found")
+        return cls(
+            [key.strip() for key in api_keys_string.split(";") if key.strip()],
+            rpm=float(os.getenv("GEMINI_KEY_RPM", "15")),
+            tpm=float(os.getenv("GEMINI_KEY_TPM", "1000000")),
+            cooldown=float(os.getenv("GEMINI_KEY_COOLDOWN", "30")),
+            max_cooldown=float(os.getenv("GEMINI_KEY_MAX_COOLDOWN", "600")),
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(
+        self, estimated_tokens: int = 0, timeout: float = 120, cancel=None
+    ) -> APIKey:
+        """
+        Reserve a key for one request of roughly `estimated_tokens` tokens.
+
+        Blocks until a key has budget; raises NoKeyAvailable if every key
+        is disabled or none frees up within `timeout` seconds, and
+        TaskCancelled as soon as the CancelToken cancel is cancelled.
+        """
+        if cancel is None:
+            return self._acquire(estimated_tokens, timeout)
+        with cancel.on_cancel(self._wake):
+            return self._acquire(estimated_tokens, timeout, cancel)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _acquire(self, estimated_tokens: int, timeout: float, cancel=None) -> APIKey:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                now = time.monotonic()
+                best = None
+                next_ready = None
+                for key in self.keys:
+                    if key.disabled:
+                        continue
+                    wait = max(
+                        key.cooldown_until - now,
+                        key.requests.wait_time(1, now),
+                        key.token_budget.wait_time(estimated_tokens, now),
+                    )
+                    if wait > 0:
+                        next_ready = wait if next_ready is None else min(next_ready, wait)
+                        continue
+                    rank = (key.in_flight, -key.requests.tokens)
+                    if best is None or rank < best[0]:
+                        best = (rank, key)
+
+                if best is not None:
+                    key = best[1]
+                    key.requests.consume(1, now)
+                    key.token_budget.consume(estimated_tokens, now)
+                    key.in_flight += 1
+                    key.calls += 1
+                    return key
+
+                if next_ready is None:
+                    raise NoKeyAvailable("All API keys have been disabled")
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise NoKeyAvailable(
+                        f"No API key available within {timeout:.0f}s "
+                        "(all keys rate limited or cooling down)"
+                    )
+                self._cond.wait(min(next_ready, remaining))
+
+    def release(
+        self,
+        key: APIKey,
+        estimated_tokens: int = 0,
+        tokens_used: int = None,
+        error: str = None,
+        quota: bool = False,
+        invalid: bool = False,
+        retry_after: float = None,
+    ):
+        """
+        Return a key after a request.
+
+        tokens_used corrects the token bucket for the real usage. quota=True
+        starts (or extends) a cooldown, lasting at least retry_after seconds
+        when the server said how long to wait; invalid=True disables the key.
+        """
+        with self._cond:
+            now = time.monotonic()
+            key.in_flight -= 1
+            if tokens_used is not None and tokens_used != estimated_tokens:
+                if tokens_used > estimated_tokens:
+                    key.token_budget.consume(tokens_used - estimated_tokens, now)
+                else:
+                    key.token_budget.refund(estimated_tokens - tokens_used, now)
+
+            if invalid:
+                key.errors += 1
+                key.disabled = True
+                print(f"❌ API key {key.label} disabled: {error}")
+            elif quota:
+                key.errors += 1
+                key.quota_errors += 1
+                key.consecutive_failures += 1
+                delay = min(
+                    self.max_cooldown,
+                    self.cooldown * 2 ** (key.consecutive_failures - 1),
+                )
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                key.cooldown_until = now + delay
+                print(f"⏳ API key {key.label} cooling down for {delay:.0f}s: {error}")
+            elif error:
+                key.errors += 1
+            else:
+                key.consecutive_failures = 0
+            self._cond.notify_all()
+
+    def stats(self) -> list:
+        with self._cond:
+            now = time.monotonic()
+            return [
+                {
+                    "key": key.label,
+                    "in_flight": key.in_flight,
+                    "calls": key.calls,
+                    "errors": key.errors,
+                    "quota_errors": key.quota_errors,
+                    "disabled": key.disabled,
+                    "cooldown_remaining": round(max(0.0, key.cooldown_until - now), 1),
+                    "rpm_available": round(key.requests.tokens, 1),
+                    "tpm_available": round(key.token_budget.tokens),
+                }
+                for key in self.keys
+            ]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool(create: bool = True) -> KeyPool:
+    """
+    The shared key pool of this process, created on first use.
+    With create=False, returns None if no Gemini call has been made yet.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None and create:
+            _pool = KeyPool.from_env()
+        return _pool
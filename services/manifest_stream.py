@@ -0,0 +1,144 @@
+import json
+
+# Lenient decoder: LLM output often has raw newlines/tabs inside strings
+_string_decoder = json.JSONDecoder(strict=False)
+
+
+class ManifestStreamParser:
+    """
+    Incremental parser for a streamed `{"folders": [...], "files": {...}}` manifest.
+
+    Also understands the structured-output shape, where "files" is a list
+    of {"path": ..., "content": ...} objects.
+
+    feed() accepts text chunks as they arrive and returns the entries that
+    became complete in that chunk, as ("folder", path) or
+    ("file", path, content) tuples. Anything before the first "{" (prose,
+    code fences) is skipped. Only the manifest's own entries are reported;
+    the full document is still validated separately once the stream ends.
+    """
+
+    def __init__(self):
+        self._pos = 0  # next character to scan in the joined buffer
+        self._text = ""
+        self._started = False
+        self._stack = []  # "{" / "[" containers currently open
+        self._keys = []  # last key seen at each open object level
+        self._expect_key = []  # per open object: is the next string a key?
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._entry = {}  # fields of the current {"path", "content"} object
+        self.done = False
+        self.folders = []
+        self.files = {}
+
+    def feed(self, chunk: str) -> list:
+        if self.done or not chunk:
+            return []
+        self._text += chunk
+        events = []
+        text = self._text
+        i = self._pos
+
+        while i < len(text) and not self.done:
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    event = self._string_done(text[self._string_start : i + 1])
+                    if event:
+                        events.append(event)
+                i += 1
+                continue
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._open("{")
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._open(ch)
+            elif ch in "}]":
+                self._close()
+            elif ch == ":" and self._stack and self._stack[-1] == "{":
+                self._expect_key[-1] = False
+            elif ch == "," and self._stack and self._stack[-1] == "{":
+                self._expect_key[-1] = True
+            i += 1
+
+        # Keep the unfinished string (if any) and drop what has been consumed
+        keep_from = self._string_start if self._in_string else i
+        self._text = text[keep_from:]
+        self._string_start -= keep_from
+        self._pos = i - keep_from
+        return events
+
+    def _open(self, kind: str):
+        self._stack.append(kind)
+        if kind == "{":
+            self._keys.append(None)
+            self._expect_key.append(True)
+            self._entry = {}
+
+    def _close(self):
+        if not self._stack:
+            return
+        if self._stack.pop() == "{":
+            self._keys.pop()
+            self._expect_key.pop()
+        if not self._stack:
+            self.done = True
+
+    def _decode(self, literal: str):
+        try:
+            return _string_decoder.decode(literal)
+        except ValueError:
+            return None
+
+    def _string_done(self, literal: str):
+        depth = len(self._stack)
+        top = self._stack[-1]
+
+        if top == "{" and self._expect_key[-1]:
+            self._keys[-1] = self._decode(literal)
+            return None
+
+        value = self._decode(literal)
+        if value is None:
+            return None
+        section = self._keys[0]
+
+        # "folders": [ "a", "b" ]
+        if depth == 2 and top == "[" and section == "folders":
+            self.folders.append(value)
+            return ("folder", value)
+
+        # "files": { "path": "content" }
+        if depth == 2 and top == "{" and section == "files":
+            path = self._keys[-1]
+            if path is None:
+                return None
+            self.files[path] = value
+            return ("file", path, value)
+
+        # "files": [ {"path": "...", "content": "..."} ]
+        if depth == 3 and top == "{" and self._stack[1] == "[" and section == "files":
+            self._entry[self._keys[-1]] = value
+            if "path" in self._entry and "content" in self._entry:
+                path, content = self._entry["path"], self._entry["content"]
+                self._entry = {}
+                self.files[path] = content
+                return ("file", path, content)
+
+        return None
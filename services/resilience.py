@@ -0,0 +1,205 @@
+import math
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from .metrics import CIRCUIT_OPENED
+
+# Backoff ceiling shared by the providers' retries; a server asking for a
+# longer wait than this is not retried
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+
+# A provider failing this many calls in a row is cut off for
+# CIRCUIT_RESET_TIMEOUT seconds, then probed with a single call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpen(Exception):
+    """
+    A provider's circuit breaker is open; try again after retry_after
+    seconds. probing is True when a probe call is deciding whether it closes.
+    """
+
+    def __init__(self, provider: str, retry_after: float, probing: bool = False):
+        super().__init__(
+            f"{provider} is unavailable (circuit open after repeated failures), "
+            f"retry in {math.ceil(retry_after)}s"
+        )
+        self.provider = provider
+        self.retry_after = retry_after
+        self.probing = probing
+
+
+def backoff_delay(
+    retry: int, base: float, cap: float = None, retry_after: float = None
+) -> float:
+    """
+    Seconds to wait before retry number `retry` (1 for the first retry):
+    "full jitter", uniform between 0 and base * 2**(retry - 1) capped at
+    cap, but never less than the server's retry_after hint.
+    """
+    if cap is None:
+        cap = RETRY_MAX_DELAY
+    delay = random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def parse_retry_after(value) -> float:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Process-wide circuit breaker for one upstream provider.
+
+    Closed, every call goes through and consecutive failures are counted;
+    at `threshold` the breaker opens and calls fail fast with CircuitOpen
+    for `reset_timeout` seconds. Then it is half-open: a single probe call
+    is let through, whose success closes the breaker and whose failure
+    opens it again. Only provider failures (network errors, timeouts, 5xx,
+    and the rate limits of a provider shared by every caller, like notegpt)
+    should be recorded as failures. A call the provider answered, even with
+    an error about the request or a per-key quota (Gemini's 429s, handled
+    by the key pool), is a success. Every call let through must end with
+    record_success(), record_failure() or, if it was never made,
+    abandon_probe(): a probe without a verdict holds other callers back.
+    """
+
+    # How often callers waiting for a probe's verdict check again
+    PROBE_POLL = 0.5
+
+    def __init__(self, name: str, threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def retry_after(self) -> float:
+        """Seconds until a call would be let through (0 = now)"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "open":
+                return self._opened_at + self.reset_timeout - now
+            if state == "half_open" and self._probe_running(now):
+                return self.PROBE_POLL
+            return 0.0
+
+    def _probe_running(self, now: float) -> bool:
+        # A probe that never reported back (e.g. cancelled) is replaced
+        return self._probe_at is not None and now - self._probe_at < self.reset_timeout
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpen unless the call may go ahead (never blocks).
+        Returns True if the call is the half-open probe.
+        """
+        if not self.threshold:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "open":
+                raise CircuitOpen(self.name, self._opened_at + self.reset_timeout - now)
+            if state == "half_open":
+                if self._probe_running(now):
+                    raise CircuitOpen(self.name, self.PROBE_POLL, probing=True)
+                self._probe_at = now
+                return True
+            return False
+
+    def admit(self, sleep=time.sleep):
+        """
+        before_call() for callers that may block: while a probe is in flight
+        they wait for its verdict (with sleep, e.g. a CancelToken's wait)
+        instead of failing; an open breaker still fails fast. Returns True
+        if the call is the half-open probe.
+        """
+        while True:
+            try:
+                return self.before_call()
+            except CircuitOpen as e:
+                if not e.probing:
+                    raise
+                sleep(e.retry_after)
+
+    def abandon_probe(self):
+        """The probe call was not made after all: let the next caller probe"""
+        with self._lock:
+            self._probe_at = None
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                print(f"✅ {self.name} recovered, circuit closed")
+            self._failures = 0
+            self._opened_at = self._probe_at = None
+
+    def record_failure(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._failures += 1
+            if self._probe_at is not None or (
+                self._opened_at is None and self._failures >= self.threshold
+            ):
+                self._opened_at = now
+                self._probe_at = None
+                CIRCUIT_OPENED.inc(provider=self.name)
+                print(
+                    f"🔌 {self.name} circuit open for {self.reset_timeout:g}s "
+                    f"after {self._failures} failures in a row"
+                )
+
+
+# One breaker per provider, shared by every job in the process
+breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = breakers.get(name)
+        if breaker is None:
+            breaker = breakers[name] = CircuitBreaker(
+                name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+            )
+        return breaker
+
+
+def providers_retry_after() -> float:
+    """Seconds until every open breaker lets calls through again (0 = none open)"""
+    with _breakers_lock:
+        current = list(breakers.values())
+    return max([breaker.retry_after() for breaker in current] + [0.0])
@@ -1,28 +1,233 @@
 import os
 import shutil
+import threading
+import zipfile
 
+from .tracing import stage
 
-def scaffold(manifest, task_id):
-    # FIXED: Use /tmp instead of relative paths
-    target_dir = f"/tmp/{task_id}_project"
 
-    # 1. Clean and recreate the target dir
-    if os.path.exists(target_dir):
-        shutil.rmtree(target_dir)
-    os.makedirs(target_dir)
+class ProjectArchive:
+    """
+    Builds a project zip straight from manifest entries, one file at a time.
 
-    # 2. Create all folders
-    for folder in manifest["folders"]:
-        os.makedirs(os.path.join(target_dir, folder), exist_ok=True)
+    Writes to a path or to any writable file object (seekable or not), so
+    the same code produces an archive on disk or a streamed response.
+    """
+
+    def __init__(self, target):
+        self._zip = zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED)
+        self._folders = set()
+
+    def add_folder(self, folder: str):
+        folder = folder.strip("/")
+        if not folder or folder in self._folders:
+            return
+        # Parent folders first, matching what make_archive would produce
+        parent = os.path.dirname(folder)
+        if parent:
+            self.add_folder(parent)
+        self._folders.add(folder)
+        self._zip.writestr(f"{folder}/", "")
+
+    def add_file(self, relpath: str, content: str):
+        relpath = relpath.lstrip("/")
+        parent = os.path.dirname(relpath)
+        if parent:
+            self.add_folder(parent)
+        self._zip.writestr(relpath, content)
+
+    def close(self):
+        self._zip.close()
+
+
+class _ChunkBuffer:
+    """Write-only file object collecting bytes until they are drained"""
+
+    def __init__(self):
+        self._chunks = []
 
-    # 3. Write all files
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_project_zip(manifest):
+    """Yield the project zip in chunks, without touching the disk"""
+    buffer = _ChunkBuffer()
+    archive = ProjectArchive(buffer)
+
+    for folder in manifest["folders"]:
+        archive.add_folder(folder)
     for relpath, content in manifest["files"].items():
-        fullpath = os.path.join(target_dir, relpath)
-        # ensure parent dir exists
-        os.makedirs(os.path.dirname(fullpath), exist_ok=True)
-        with open(fullpath, "w", encoding="utf-8") as f:
-            f.write(content)
-
-    # 4. Zip it up
-    shutil.make_archive(target_dir, "zip", target_dir)
+        archive.add_file(relpath, content)
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
+
+    archive.close()
+    yield buffer.drain()
+
+
+def scaffold(
+    manifest,
+    task_id,
+    expand: bool = False,
+    out_dir: str = "/tmp",
+    run_info=None,
+    cancel=None,
+):
+    """
+    Write the project zip for a manifest to {out_dir}/{task_id}_project.zip.
+
+    The archive is built directly from the manifest in a single write.
+    Pass expand=True to also create the {out_dir}/{task_id}_project directory tree.
+    Timings are recorded as "scaffold_write" / "zip" spans in run_info, if given.
+    A cancelled CancelToken cancel stops the writing between two files
+    (TaskCancelled); the partial output is left to remove_artifacts().
+    """
+    # FIXED: Use /tmp instead of relative paths
+    target_dir = os.path.join(out_dir, f"{task_id}_project")
+
+    if expand:
+        with stage("scaffold_write", run_info, files=len(manifest["files"])):
+            # 1. Clean and recreate the target dir
+            if os.path.exists(target_dir):
+                shutil.rmtree(target_dir)
+            os.makedirs(target_dir)
+
+            # 2. Create all folders
+            for folder in manifest["folders"]:
+                os.makedirs(os.path.join(target_dir, folder), exist_ok=True)
+
+            # 3. Write all files
+            for relpath, content in manifest["files"].items():
+                if cancel is not None:
+                    cancel.check()
+                fullpath = os.path.join(target_dir, relpath)
+                # ensure parent dir exists
+                os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+                with open(fullpath, "w", encoding="utf-8") as f:
+                    f.write(content)
+
+    # 4. Zip it up, straight from the manifest
+    with stage("zip", run_info, files=len(manifest["files"])):
+        tmp_path = f"{target_dir}.zip.tmp"
+        archive = ProjectArchive(tmp_path)
+        try:
+            for folder in manifest["folders"]:
+                archive.add_folder(folder)
+            for relpath, content in manifest["files"].items():
+                if cancel is not None:
+                    cancel.check()
+                archive.add_file(relpath, content)
+        finally:
+            archive.close()
+        os.replace(tmp_path, f"{target_dir}.zip")
     print(f"Project scaffolded and zipped as {target_dir}.zip")
+
+
+class StreamingScaffold:
+    """
+    Listener for streamed manifest generation.
+
+    Counts entries as they arrive (reporting progress through on_progress)
+    and, with write_archive=True, adds each file to the task's zip as soon
+    as its content is complete, overlapping generation with archiving.
+
+    Once the CancelToken cancel is cancelled, entries are refused with
+    TaskCancelled, so a generation abandoned in the background cannot
+    write to the archive after abort().
+    """
+
+    def __init__(
+        self, task_id, write_archive: bool = True, on_progress=None, cancel=None
+    ):
+        self.task_id = task_id
+        self.write_archive = write_archive
+        self.on_progress = on_progress
+        self.cancel = cancel
+        self._lock = threading.RLock()
+        self.files_done = 0
+        self._tmp_path = f"/tmp/{task_id}_project.zip.tmp"
+        self._archive = None
+        self._written = {}
+        self._dirty = False
+
+    def _check(self):
+        if self.cancel is not None:
+            self.cancel.check()
+
+    def start(self):
+        """Called at the start of each generation attempt: begin a fresh archive"""
+        with self._lock:
+            self._check()
+            self.abort()
+            self.files_done = 0
+            self._written = {}
+            self._dirty = False
+            if self.write_archive:
+                self._archive = ProjectArchive(self._tmp_path)
+
+    def folder(self, path):
+        with self._lock:
+            self._check()
+            if self._archive is not None:
+                self._archive.add_folder(path)
+
+    def file(self, path, content):
+        with self._lock:
+            self._check()
+            if path in self._written:
+                # A repeated path would leave duplicate zip entries; rebuild at the end
+                self._dirty = True
+            elif self._archive is not None:
+                self._archive.add_file(path, content)
+            self._written[path] = content
+            self.files_done += 1
+        if self.on_progress:
+            self.on_progress(self.files_done)
+
+    def finish(self, manifest, run_info=None):
+        """
+        Complete the zip for the final manifest. Falls back to a full
+        scaffold() when nothing was streamed (e.g. a cache hit) or the
+        streamed entries differ from the validated manifest.
+        """
+        if not self.write_archive:
+            return
+        if self._archive is None or self._dirty or self._written != manifest["files"]:
+            self.abort()
+            scaffold(
+                manifest=manifest,
+                task_id=self.task_id,
+                run_info=run_info,
+                cancel=self.cancel,
+            )
+            return
+
+        # Folders without files may only be listed in the final manifest
+        with stage("zip", run_info, files=len(manifest["files"]), streamed=True):
+            for folder in manifest["folders"]:
+                self._archive.add_folder(folder)
+            self._archive.close()
+            self._archive = None
+            target = f"/tmp/{self.task_id}_project.zip"
+            os.replace(self._tmp_path, target)
+        print(f"Project scaffolded and zipped as {target}")
+
+    def abort(self):
+        """Discard a partially written archive"""
+        with self._lock:
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
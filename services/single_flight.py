@@ -0,0 +1,59 @@
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent jobs for the same key.
+
+    The first task submitted for a key becomes the leader and does the work;
+    tasks submitted for the same key while the leader is running attach to it
+    as followers and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leaders = {}  # key -> leader task_id
+        self._keys = {}  # leader task_id -> key
+        self._followers = {}  # leader task_id -> [follower task_id, ...]
+
+    def join(self, key: str, task_id: str):
+        """
+        Register task_id for key.
+
+        Returns the leader's task_id if a job for key is already in flight
+        (task_id is now one of its followers), or None if task_id is the new
+        leader and must run the job.
+        """
+        with self._lock:
+            leader = self._leaders.get(key)
+            if leader is not None:
+                self._followers[leader].append(task_id)
+                return leader
+            self._leaders[key] = task_id
+            self._keys[task_id] = key
+            self._followers[task_id] = []
+            return None
+
+    def followers(self, leader: str) -> list:
+        """Snapshot of the followers attached to a running leader"""
+        with self._lock:
+            return list(self._followers.get(leader, ()))
+
+    def leave(self, leader: str, task_id: str):
+        """Detach a follower from its leader"""
+        with self._lock:
+            followers = self._followers.get(leader)
+            if followers and task_id in followers:
+                followers.remove(task_id)
+
+    def finish(self, leader: str) -> list:
+        """Release the key held by leader and return its followers"""
+        with self._lock:
+            key = self._keys.pop(leader, None)
+            if key is not None and self._leaders.get(key) == leader:
+                del self._leaders[key]
+            return self._followers.pop(leader, [])
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._leaders)
@@ -0,0 +1,43 @@
+import sqlite3
+import threading
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Connection for a database shared by threads and processes: autocommit
+    (transactions are explicit BEGINs), WAL mode so readers never block the
+    writer, and a 30s wait on a locked database instead of failing at once.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+class ThreadConnections:
+    """Calling it returns the calling thread's own connection to path"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+
+def add_columns(conn: sqlite3.Connection, table: str, columns: dict) -> list:
+    """
+    Schema migration: add the {name: definition} columns table lacks
+    (databases created before they existed). Returns the names added.
+    """
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    added = []
+    for name, definition in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            added.append(name)
+    return added
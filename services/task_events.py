@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+
+class TaskEvents:
+    """
+    Wakes up asyncio subscribers when a task changes.
+
+    publish() may be called from any thread (worker threads, the process
+    pool's relay thread); each subscriber holds an asyncio.Event that is set
+    on its own loop. Several updates between two reads collapse into one
+    wake-up, so a subscriber always reads the latest record and never falls
+    behind a fast producer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # task_id -> {(loop, asyncio.Event), ...}
+
+    def subscribe(self, task_id: str) -> asyncio.Event:
+        """Register the running loop for task_id's updates"""
+        event = asyncio.Event()
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(
+                (asyncio.get_running_loop(), event)
+            )
+        return event
+
+    def unsubscribe(self, task_id: str, event: asyncio.Event):
+        with self._lock:
+            subscribers = self._subscribers.get(task_id)
+            if not subscribers:
+                return
+            subscribers.difference_update(
+                {entry for entry in subscribers if entry[1] is event}
+            )
+            if not subscribers:
+                del self._subscribers[task_id]
+
+    def publish(self, task_id: str):
+        with self._lock:
+            subscribers = list(self._subscribers.get(task_id, ()))
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
@@ -0,0 +1,383 @@
+import base64
+import json
+import os
+import threading
+import time
+
+from .sqlite_db import ThreadConnections, add_columns
+
+# Statuses after which a task record no longer changes (except for expiry)
+FINISHED_STATUSES = ("completed", "failed", "cancelled", "expired")
+# Statuses of tasks that still hold (or wait for) a worker
+ACTIVE_STATUSES = ("pending", "processing")
+
+
+def encode_cursor(created_at: str, task_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{task_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """(created_at, task_id) from an opaque cursor; ValueError if malformed"""
+    try:
+        created_at, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, task_id
+
+
+class MemoryTaskStore:
+    """
+    Task records in a dict. Fast, but private to one process and lost on
+    restart; mostly useful for development and tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def create(self, record: dict):
+        with self._lock:
+            self._tasks[record["task_id"]] = dict(record, version=1)
+
+    def get(self, task_id: str):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id: str, fields: dict) -> bool:
+        """
+        Merge fields into a task, bumping its version if anything changed.
+        False if the task does not exist.
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return False
+            if any(task.get(k) != v for k, v in fields.items()):
+                task.update(fields)
+                task["version"] += 1
+            return True
+
+    def version(self, task_id: str):
+        """Current version of a task (None if it does not exist)"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task["version"] if task is not None else None
+
+    def delete(self, task_id: str):
+        """Remove a task and return its record (None if it did not exist)"""
+        with self._lock:
+            return self._tasks.pop(task_id, None)
+
+    def count(self, status: str = None, artifact_id: str = None) -> int:
+        with self._lock:
+            return sum(
+                1
+                for t in self._tasks.values()
+                if (status is None or t["status"] == status)
+                and (artifact_id is None or t.get("artifact_id") == artifact_id)
+            )
+
+    def count_active(self, client: str) -> int:
+        """Pending or processing tasks submitted by client"""
+        with self._lock:
+            return sum(
+                1
+                for t in self._tasks.values()
+                if t["status"] in ACTIVE_STATUSES and t.get("client") == client
+            )
+
+    def renew(self, owner: str):
+        """Records live and die with this process: nothing to renew"""
+
+    def interrupted(self, limit: int = 500) -> list:
+        """Active tasks whose owner stopped renewing them (never, in memory)"""
+        return []
+
+    def with_artifact(self, artifact_id: str) -> list:
+        """Every task sharing the given artifact"""
+        with self._lock:
+            return [
+                dict(t)
+                for t in self._tasks.values()
+                if t.get("artifact_id") == artifact_id
+            ]
+
+    def finished_before(self, cutoff: str, limit: int = 500) -> list:
+        """Finished tasks whose completed_at is older than cutoff (ISO time)"""
+        with self._lock:
+            rows = [
+                dict(t)
+                for t in self._tasks.values()
+                if t["status"] in FINISHED_STATUSES
+                and t.get("completed_at")
+                and t["completed_at"] < cutoff
+            ]
+        rows.sort(key=lambda t: t["completed_at"])
+        return rows[:limit]
+
+    def list(self, status: str = None, limit: int = 50, cursor: str = None):
+        """
+        Newest tasks first, optionally filtered by status.
+
+        Returns (tasks, next_cursor); next_cursor is None on the last page.
+        """
+        with self._lock:
+            rows = [
+                t
+                for t in self._tasks.values()
+                if status is None or t["status"] == status
+            ]
+        rows.sort(key=lambda t: (t["created_at"], t["task_id"]), reverse=True)
+        if cursor:
+            after = decode_cursor(cursor)
+            rows = [t for t in rows if (t["created_at"], t["task_id"]) < after]
+        page = [dict(t) for t in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["task_id"])
+        return page, next_cursor
+
+
+class SQLiteTaskStore:
+    """
+    Task records in a SQLite database (WAL mode), shared by every process
+    that opens the same file and kept across restarts.
+
+    Status, creation/completion time and artifact are real, indexed columns;
+    the rest of the record is stored as JSON. Each thread uses its own
+    connection, and updates run in an immediate transaction so concurrent
+    writers from several processes never lose each other's fields.
+
+    A record with an "owner" (the API process running its job) is leased
+    to it for `lease` seconds, renewed with renew(). If the owner dies, the
+    lease runs out: the task no longer counts as active and interrupted()
+    reports it, so it can be failed instead of staying in progress forever.
+    """
+
+    def __init__(self, path: str, lease: float = 60):
+        self.path = path
+        self.lease = lease
+        self._conn = ThreadConnections(path)
+        conn = self._conn()
+        with conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    artifact_id TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tasks_status_created
+                    ON tasks (status, created_at, task_id);
+                CREATE INDEX IF NOT EXISTS tasks_created
+                    ON tasks (created_at, task_id);
+                CREATE INDEX IF NOT EXISTS tasks_artifact
+                    ON tasks (artifact_id);
+                """
+            )
+            added = add_columns(
+                conn,
+                "tasks",
+                {
+                    "completed_at": "TEXT",
+                    "version": "INTEGER NOT NULL DEFAULT 0",
+                    "owner": "TEXT",
+                    "lease_until": "REAL",
+                },
+            )
+            if "completed_at" in added:
+                conn.execute(
+                    "UPDATE tasks SET completed_at = "
+                    "json_extract(data, '$.completed_at')"
+                )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (completed_at)"
+            )
+
+    def create(self, record: dict):
+        record = dict(record, version=1)
+        owner = record.get("owner")
+        self._conn().execute(
+            "INSERT INTO tasks (task_id, status, created_at, completed_at, "
+            "artifact_id, version, owner, lease_until, data) "
+            "VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)",
+            (
+                record["task_id"],
+                record["status"],
+                record["created_at"],
+                record.get("completed_at"),
+                record.get("artifact_id"),
+                owner,
+                time.time() + self.lease if owner else None,
+                json.dumps(record),
+            ),
+        )
+
+    def get(self, task_id: str):
+        row = self._conn().execute(
+            "SELECT data, version FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row[0]), version=row[1])
+
+    def version(self, task_id: str):
+        """Current version of a task (None if it does not exist)"""
+        row = self._conn().execute(
+            "SELECT version FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def update(self, task_id: str, fields: dict) -> bool:
+        """
+        Merge fields into a task, bumping its version if anything changed.
+        False if the task does not exist.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data, version FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+            task = json.loads(row[0])
+            if any(task.get(k) != v for k, v in fields.items()):
+                task.update(fields)
+                task["version"] = row[1] + 1
+                conn.execute(
+                    "UPDATE tasks SET status = ?, completed_at = ?, artifact_id = ?, "
+                    "version = ?, data = ? WHERE task_id = ?",
+                    (
+                        task["status"],
+                        task.get("completed_at"),
+                        task.get("artifact_id"),
+                        task["version"],
+                        json.dumps(task),
+                        task_id,
+                    ),
+                )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, task_id: str):
+        """Remove a task and return its record (None if it did not exist)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row else None
+
+    def count(self, status: str = None, artifact_id: str = None) -> int:
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if artifact_id is not None:
+            clauses.append("artifact_id = ?")
+            params.append(artifact_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM tasks{where}", params
+        ).fetchone()[0]
+
+    def count_active(self, client: str) -> int:
+        """Pending or processing tasks submitted by client (live leases only)"""
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM tasks WHERE status IN ({placeholders}) "
+            "AND (lease_until IS NULL OR lease_until >= ?) "
+            "AND json_extract(data, '$.client') = ?",
+            (*ACTIVE_STATUSES, time.time(), client),
+        ).fetchone()[0]
+
+    def renew(self, owner: str):
+        """Extend the leases of owner's active tasks"""
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        self._conn().execute(
+            f"UPDATE tasks SET lease_until = ? WHERE owner = ? "
+            f"AND status IN ({placeholders})",
+            (time.time() + self.lease, owner, *ACTIVE_STATUSES),
+        )
+
+    def interrupted(self, limit: int = 500) -> list:
+        """Active tasks whose owner stopped renewing their lease"""
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        rows = self._conn().execute(
+            f"SELECT data FROM tasks WHERE status IN ({placeholders}) "
+            "AND lease_until < ? LIMIT ?",
+            (*ACTIVE_STATUSES, time.time(), limit),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def with_artifact(self, artifact_id: str) -> list:
+        """Every task sharing the given artifact"""
+        rows = self._conn().execute(
+            "SELECT data FROM tasks WHERE artifact_id = ?", (artifact_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def finished_before(self, cutoff: str, limit: int = 500) -> list:
+        """Finished tasks whose completed_at is older than cutoff (ISO time)"""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        rows = self._conn().execute(
+            "SELECT data FROM tasks WHERE completed_at < ? "
+            f"AND status IN ({placeholders}) ORDER BY completed_at LIMIT ?",
+            (cutoff, *FINISHED_STATUSES, limit),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def list(self, status: str = None, limit: int = 50, cursor: str = None):
+        """
+        Newest tasks first, optionally filtered by status.
+
+        Returns (tasks, next_cursor); next_cursor is None on the last page.
+        """
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if cursor:
+            clauses.append("(created_at, task_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT data FROM tasks{where} "
+            "ORDER BY created_at DESC, task_id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        page = [json.loads(row[0]) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["task_id"])
+        return page, next_cursor
+
+
+def open_task_store():
+    """
+    Task store selected by TASK_STORE: "sqlite" (default, at TASK_DB_PATH,
+    with leases of TASK_LEASE seconds) or "memory".
+    """
+    backend = os.getenv("TASK_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryTaskStore()
+    if backend == "sqlite":
+        return SQLiteTaskStore(
+            os.getenv("TASK_DB_PATH", "/tmp/y2p_tasks.db"),
+            lease=float(os.getenv("TASK_LEASE", "60")),
+        )
+    raise ValueError(f"Unknown TASK_STORE: {backend}")
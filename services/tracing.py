@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+
+from .metrics import STAGE_SECONDS
+
+
+@contextmanager
+def stage(name: str, run_info: dict = None, **attrs):
+    """
+    Time one pipeline stage.
+
+    The duration always feeds the y2p_stage_duration_seconds histogram;
+    when run_info is given, a span is also appended to run_info["spans"]
+    for the task's own timing breakdown. The span dict is yielded so the
+    block can attach details (key used, token counts, ...).
+    """
+    span = {"name": name, "start": time.time(), **attrs}
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=name)
+        span["duration"] = round(duration, 4)
+        if run_info is not None:
+            run_info.setdefault("spans", []).append(span)
+
+
+def build_timings(queued_at: float, started_at: float, spans: list, **extra) -> dict:
+    """
+    Timing breakdown of a task for its record.
+
+    Span start times become offsets in seconds from submission (queued_at),
+    so the list reads as a waterfall; extra fields (sizes, token counts,
+    retries) are included as they are.
+    """
+    now = time.time()
+    queue_wait = round(started_at - queued_at, 4)
+    stages = [{"name": "queue_wait", "start": 0.0, "duration": queue_wait}]
+    for span in sorted(spans, key=lambda s: s["start"]):
+        stages.append(dict(span, start=round(span["start"] - queued_at, 4)))
+    return {
+        "queue_wait": queue_wait,
+        "elapsed": round(now - queued_at, 4),
+        "stages": stages,
+        **extra,
+    }
+
+
+def to_chrome_trace(task_id: str, timings: dict) -> dict:
+    """
+    Export a timing breakdown in Chrome Trace Event format, viewable in
+    chrome://tracing or https://ui.perfetto.dev. Parallel map-reduce
+    chunks get their own track.
+    """
+    events = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": 1,
+            "args": {"name": f"task {task_id}"},
+        }
+    ]
+    for span in timings.get("stages", []):
+        args = {k: v for k, v in span.items() if k not in ("name", "start", "duration")}
+        events.append(
+            {
+                "name": span["name"],
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": int(span["start"] * 1_000_000),
+                "dur": int(span["duration"] * 1_000_000),
+                "pid": 1,
+                "tid": span.get("chunk", 0),
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,263 @@
+import multiprocessing
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class FairQueue:
+    """
+    Bounded job queue shared fairly between clients.
+
+    Each client has its own FIFO; get() serves the clients round-robin, so
+    a client with a long backlog delays everyone else by at most one job
+    per turn instead of by its whole backlog.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self._cond = threading.Condition()
+        self._clients = OrderedDict()  # client -> deque of jobs, in turn order
+        self._size = 0
+        self._closed = False
+
+    def put_nowait(self, item, client=None):
+        """Queue item for client; raises QueueFull when at maxsize"""
+        with self._cond:
+            if self.maxsize and self._size >= self.maxsize:
+                raise QueueFull(f"Job queue is full ({self._size} waiting)")
+            jobs = self._clients.get(client)
+            if jobs is None:
+                # A new client joins at the end of the turn
+                jobs = self._clients[client] = deque()
+            jobs.append(item)
+            self._size += 1
+            self._cond.notify()
+
+    def remove(self, match) -> int:
+        """Drop the waiting jobs for which match(item) is true; returns how many"""
+        removed = 0
+        with self._cond:
+            for client, jobs in list(self._clients.items()):
+                kept = deque(item for item in jobs if not match(item))
+                removed += len(jobs) - len(kept)
+                if kept:
+                    self._clients[client] = kept
+                else:
+                    del self._clients[client]
+            self._size -= removed
+        return removed
+
+    def close(self) -> list:
+        """Drop the waiting jobs and make get() return None; returns the dropped jobs"""
+        with self._cond:
+            self._closed = True
+            dropped = [item for jobs in self._clients.values() for item in jobs]
+            self._clients.clear()
+            self._size = 0
+            self._cond.notify_all()
+        return dropped
+
+    def get(self):
+        """Next job, blocking until there is one (None once closed)"""
+        with self._cond:
+            while not self._size:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            client, jobs = self._clients.popitem(last=False)
+            item = jobs.popleft()
+            if jobs:
+                self._clients[client] = jobs  # back of the line
+            self._size -= 1
+            return item
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._size
+
+    def clients(self) -> int:
+        """Clients with jobs waiting"""
+        with self._cond:
+            return len(self._clients)
+
+
+# Status updates sent from child processes back to the API process
+_child_updates = None
+
+
+def _init_child(update_queue):
+    """Initializer for process workers: remember the update channel"""
+    global _child_updates
+    _child_updates = update_queue
+
+
+def _child_update(*args, **kwargs):
+    """Forward a status update from a child process to the parent"""
+    _child_updates.put((args, kwargs))
+
+
+def _run_in_child(target, args):
+    return target(*args, update=_child_update)
+
+
+class WorkerPool:
+    """Bounded fair queue feeding a fixed pool of thread or process workers"""
+
+    def __init__(
+        self,
+        target,
+        on_update,
+        workers: int = 4,
+        queue_size: int = 100,
+        mode: str = "thread",
+        gate=None,
+    ):
+        """
+        Args:
+            target: Job function, called as target(*args, update=on_update)
+            on_update: Status callback, always invoked in this process
+            workers: Number of jobs that may run at the same time
+            queue_size: Maximum number of jobs waiting for a worker
+            mode: "thread" to run jobs in threads, "process" to run them
+                in a process pool (status updates are relayed back)
+            gate: Optional callable returning how many seconds to hold off
+                before starting the next job (0 = go); jobs wait in the
+                queue meanwhile
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode: {mode}")
+        if workers < 1:
+            raise ValueError("Worker pool needs at least one worker")
+
+        self.target = target
+        self.on_update = on_update
+        self.workers = workers
+        self.mode = mode
+        self.gate = gate
+        self.jobs = FairQueue(maxsize=queue_size)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self._executor = None
+        self._updates = None
+        self._started = False
+        self._stopping = threading.Event()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.jobs.qsize()
+
+    def start(self):
+        """Start the dispatcher threads (and process pool, if enabled)"""
+        if self._started:
+            return
+        self._started = True
+        self._stopping.clear()
+
+        if self.mode == "process":
+            self._updates = multiprocessing.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_child,
+                initargs=(self._updates,),
+            )
+            relay = threading.Thread(
+                target=self._relay_updates, name="worker-pool-relay", daemon=True
+            )
+            relay.start()
+            self._threads.append(relay)
+
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop, name=f"worker-pool-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        print(f"✅ Worker pool started: {self.workers} {self.mode} workers")
+
+    def submit(self, *args, client: str = None):
+        """
+        Queue a job without blocking; raises QueueFull when saturated.
+        Jobs of different clients are dispatched round-robin.
+        """
+        self.jobs.put_nowait(args, client)
+
+    def cancel(self, match) -> int:
+        """Drop the queued jobs whose arguments satisfy match(args); returns how many"""
+        return self.jobs.remove(match)
+
+    def shutdown(self):
+        """
+        Stop accepting work, fail the jobs still waiting in the queue (their
+        first argument is the task_id) and wait for running jobs to finish
+        """
+        if not self._started:
+            return
+        self._stopping.set()
+        dropped = self.jobs.close()
+        for args in dropped:
+            try:
+                self.on_update(
+                    args[0],
+                    "failed",
+                    "Failed to process video",
+                    error="Server shutting down",
+                )
+            except Exception as e:
+                print(f"❌ Failed to apply status update: {e}")
+        if dropped:
+            print(f"🛑 Worker pool: {len(dropped)} queued jobs failed on shutdown")
+        for thread in self._threads:
+            if thread.name != "worker-pool-relay":
+                thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._updates.put(None)
+        self._started = False
+
+    def _hold_off(self):
+        while self.gate is not None and not self._stopping.is_set():
+            try:
+                delay = self.gate()
+            except Exception as e:
+                print(f"⚠️ Worker pool gate failed: {e}")
+                return
+            if delay <= 0:
+                return
+            self._stopping.wait(min(delay, 1.0))
+
+    def _worker_loop(self):
+        while True:
+            self._hold_off()
+            args = self.jobs.get()
+            if args is None:
+                break
+
+            with self._lock:
+                self.in_flight += 1
+            try:
+                if self._executor is not None:
+                    self._executor.submit(_run_in_child, self.target, args).result()
+                else:
+                    self.target(*args, update=self.on_update)
+            except Exception as e:
+                print(f"❌ Worker job failed: {e}")
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def _relay_updates(self):
+        while True:
+            item = self._updates.get()
+            if item is None:
+                break
+            args, kwargs = item
+            try:
+                self.on_update(*args, **kwargs)
+            except Exception as e:
+                print(f"❌ Failed to apply status update: {e}")
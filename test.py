@@ -4,6 +4,7 @@ Example client for the YouTube Tutorial Scaffold API
 Shows how to submit a video, track progress, and download the result
 """
 
+import json
 import requests
 import time
 
@@ -21,6 +22,11 @@ def submit_video(url: str) -> str:
         print(f"📋 Task ID: {data['task_id']}")
         print(f"📝 Status: {data['status']}")
         return data["task_id"]
+    elif response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "a few")
+        print(f"⏳ Server busy: {response.json()['detail']}")
+        print(f"🔁 Try again in {retry_after} seconds")
+        return None
     else:
         print(f"❌ Error: {response.status_code} - {response.text}")
         return None
@@ -37,6 +43,53 @@ def check_status(task_id: str) -> dict:
         return None
 
 
+def follow_events(task_id: str):
+    """
+    Yield the task's status each time it changes (Server-Sent Events).
+    The stream ends when the task is finished or deleted.
+    """
+    with requests.get(f"{API_BASE}/events/{task_id}", stream=True) as response:
+        response.raise_for_status()
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = "message"  # a blank line ends the event
+            elif line.startswith("event:"):
+                event = line[len("event:") :].strip()
+            elif line.startswith("data:"):
+                if event == "deleted":
+                    print("🗑️ Task was deleted")
+                    return
+                yield json.loads(line[len("data:") :])
+
+
+def poll_status(task_id: str, wait: float = 30):
+    """
+    Fallback for servers without /events: long-poll /status until finished.
+    The server holds each request until the status changes (or `wait`
+    seconds pass and it answers 304 Not Modified).
+    """
+    etag = None
+    while True:
+        headers = {"If-None-Match": etag} if etag else {}
+        response = requests.get(
+            f"{API_BASE}/status/{task_id}", params={"wait": wait}, headers=headers
+        )
+        if response.status_code == 304:
+            continue
+        if response.status_code != 200:
+            print(f"❌ Error checking status: {response.status_code} - {response.text}")
+            return
+
+        status_data = response.json()
+        yield status_data
+        if status_data["status"] not in ["pending", "processing"]:
+            return
+        etag = response.headers.get("ETag")
+        if not etag:
+            time.sleep(5)  # older server: plain polling
+
+
 def download_project(task_id: str, filename: str = None) -> bool:
     """Download the completed project"""
     if not filename:
@@ -74,40 +127,42 @@ def main():
     print("\n🔄 Monitoring task progress...")
     print("-" * 30)
 
-    # Step 2: Monitor progress
-    while True:
-        status_data = check_status(task_id)
-        if not status_data:
-            break
-
-        status = status_data["status"]
-        message = status_data["message"]
+    # Step 2: Monitor progress (pushed by the server as it happens)
+    try:
+        status_data = report_progress(follow_events(task_id))
+    except requests.RequestException:
+        print("⚠️ Live updates unavailable, falling back to long-polling")
+        status_data = report_progress(poll_status(task_id))
+    if not status_data:
+        return
 
-        print(f"📊 Status: {status.upper()}")
-        print(f"💬 Message: {message}")
+    if status_data["status"] == "completed":
+        print("✅ Processing completed!")
+        if status_data.get("download_url"):
+            print(f"🔗 Download URL: {API_BASE}{status_data['download_url']}")
 
-        if status == "completed":
-            print("✅ Processing completed!")
-            if status_data.get("download_url"):
-                print(f"🔗 Download URL: {API_BASE}{status_data['download_url']}")
+        # Step 3: Download the project
+        print("\n📥 Downloading project...")
+        if download_project(task_id):
+            print("🎉 Success! Your project is ready.")
 
-            # Step 3: Download the project
-            print("\n📥 Downloading project...")
-            if download_project(task_id):
-                print("🎉 Success! Your project is ready.")
-            break
+    elif status_data["status"] == "failed":
+        print("❌ Processing failed!")
+        if status_data.get("error"):
+            print(f"🚨 Error: {status_data['error']}")
 
-        elif status == "failed":
-            print("❌ Processing failed!")
-            if status_data.get("error"):
-                print("🚨 Error: {status_data['error']}")
-            break
+    elif status_data["status"] == "expired":
+        print("⌛ Project files expired, submit the video again")
 
-        elif status in ["pending", "processing"]:
-            print("⏳ Still working... (waiting 5 seconds)")
-            time.sleep(5)
 
+def report_progress(updates) -> dict:
+    """Print each status change; returns the last one"""
+    status_data = None
+    for status_data in updates:
+        print(f"📊 Status: {status_data['status'].upper()}")
+        print(f"💬 Message: {status_data['message']}")
         print("-" * 30)
+    return status_data
 
 
 def list_tasks():
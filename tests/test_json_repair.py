@@ -0,0 +1,44 @@
+import pytest
+
+from services.json_repair import TRUNCATION_REPAIRS, extract_json
+
+
+def test_fenced_output_is_not_a_repair():
+    raw = '```json\n{"folders": ["src"], "files": {"a.py": "x = 1"}}\n```\n'
+    manifest, repairs = extract_json(raw)
+    assert manifest == {"folders": ["src"], "files": {"a.py": "x = 1"}}
+    assert repairs == []
+
+
+def test_prose_around_fences_is_a_repair():
+    raw = 'Here is the project:\n```json\n{"files": {}}\n```\nEnjoy!'
+    manifest, repairs = extract_json(raw)
+    assert manifest == {"files": {}}
+    assert repairs == ["stripped text before JSON", "stripped text after JSON"]
+
+
+def test_trailing_commas():
+    raw = '```json\n{"folders": ["src",], "files": {"a.py": "x",},}\n```'
+    manifest, repairs = extract_json(raw)
+    assert manifest == {"folders": ["src"], "files": {"a.py": "x"}}
+    assert repairs == ["removed trailing commas"]
+
+
+def test_truncated_object_is_reported_as_cut_off():
+    # The half-written "b.py" parses, so callers must see it was cut off
+    raw = '{"folders": ["src"], "files": {"a.py": "print(1)", "b.py": "pri'
+    manifest, repairs = extract_json(raw)
+    assert manifest["files"]["a.py"] == "print(1)"
+    assert set(TRUNCATION_REPAIRS) <= set(repairs)
+
+
+def test_truncated_key_is_dropped():
+    raw = '{"files": {"a.py": "x", "b.p'
+    manifest, repairs = extract_json(raw)
+    assert manifest == {"files": {"a.py": "x"}}
+    assert "closed unclosed brackets" in repairs
+
+
+def test_no_json():
+    with pytest.raises(ValueError):
+        extract_json("Sorry, I can't help with that.")
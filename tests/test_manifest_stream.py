@@ -0,0 +1,48 @@
+from services.manifest_stream import ManifestStreamParser
+
+
+def _feed_in_chunks(parser, text, size=7):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i : i + size]))
+    return events
+
+
+def test_stream_parser_dict_shape():
+    text = (
+        '```json\n{"folders": ["src", "tests"], '
+        '"files": {"src/a.py": "print(\\"hi\\")\\n", "README.md": "# Demo"}}\n```'
+    )
+    parser = ManifestStreamParser()
+    events = _feed_in_chunks(parser, text)
+    assert events == [
+        ("folder", "src"),
+        ("folder", "tests"),
+        ("file", "src/a.py", 'print("hi")\n'),
+        ("file", "README.md", "# Demo"),
+    ]
+    assert parser.done
+
+
+def test_stream_parser_list_shape():
+    text = (
+        '{"folders": ["src"], "files": ['
+        '{"path": "src/a.py", "content": "x = {1: [2]}"}, '
+        '{"content": "# Demo", "path": "README.md"}]}'
+    )
+    parser = ManifestStreamParser()
+    events = _feed_in_chunks(parser, text, size=5)
+    assert events == [
+        ("folder", "src"),
+        ("file", "src/a.py", "x = {1: [2]}"),
+        ("file", "README.md", "# Demo"),
+    ]
+    assert parser.files == {"src/a.py": "x = {1: [2]}", "README.md": "# Demo"}
+    assert parser.done
+
+
+def test_stream_parser_truncated():
+    parser = ManifestStreamParser()
+    parser.feed('{"folders": [], "files": {"a.py": "x", "b.py": "unfini')
+    assert parser.files == {"a.py": "x"}
+    assert not parser.done
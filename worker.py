@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Queue worker for WORKER_MODE=queue
+
+The API only enqueues jobs; this process claims them from the durable job
+queue and runs the pipeline. Start as many workers as the machine allows
+(they need the same TASK_DB_PATH / JOB_DB_PATH and /tmp as the API):
+
+    WORKER_MODE=queue uvicorn app:app
+    python worker.py --concurrency 4
+"""
+
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+
+import app as api
+from services.job_queue import open_job_queue
+from services.resilience import providers_retry_after
+from services.task_store import SQLiteTaskStore
+
+# A job whose worker died this many times is given up on
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+
+class QueueWorker:
+    """Claims jobs with `concurrency` threads and keeps their leases alive"""
+
+    def __init__(self, job_queue, concurrency: int):
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+        self.worker_id = (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.running = set()  # task_ids of the jobs being run
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self):
+        self.job_queue.heartbeat(self.worker_id, self.concurrency)
+        threads = [
+            threading.Thread(target=self._claim_loop, name=f"queue-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop, name="queue-heartbeat", daemon=True
+        )
+        for thread in threads:
+            thread.start()
+        heartbeat.start()
+        print(
+            f"✅ Worker {self.worker_id} started: {self.concurrency} jobs at a time, "
+            f"queue at {self.job_queue.path}"
+        )
+        for thread in threads:
+            thread.join()
+        self.job_queue.leave(self.worker_id)
+        print(f"👋 Worker {self.worker_id} stopped")
+
+    def stop(self, *_):
+        """Finish the running jobs but claim no more"""
+        if not self._stop.is_set():
+            print("🛑 Stopping after the running jobs (Ctrl+C again to abort)")
+            self._stop.set()
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    def _heartbeat_loop(self):
+        # Runs until the last job is done, also after stop()
+        while True:
+            with self._lock:
+                running = list(self.running)
+            if self._stop.is_set() and not running:
+                return
+            try:
+                self.job_queue.heartbeat(self.worker_id, self.concurrency, running)
+            except Exception as e:
+                print(f"⚠️ Heartbeat failed: {e}")
+            time.sleep(self.job_queue.lease / 3)
+
+    def _claim_loop(self):
+        while not self._stop.is_set():
+            # Leave jobs in the queue while a provider's circuit breaker is open
+            hold_off = providers_retry_after()
+            if hold_off > 0:
+                self._stop.wait(min(hold_off, 1.0))
+                continue
+            try:
+                job = self.job_queue.claim(self.worker_id)
+            except Exception as e:
+                print(f"❌ Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+
+            with self._lock:
+                self.running.add(job["task_id"])
+            try:
+                self._run_job(job)
+            except Exception as e:
+                print(f"❌ Worker job failed: {e}")
+            finally:
+                with self._lock:
+                    self.running.discard(job["task_id"])
+                self.job_queue.done(job["task_id"])
+
+    def _run_job(self, job: dict):
+        task_id, payload = job["task_id"], job["payload"]
+        # Deleted before a worker got to it (coalesced tasks still count)
+        if not api.tasks.count(artifact_id=task_id):
+            print(f"⏭️ Skipping job {task_id}: task was deleted")
+            return
+        if job["attempts"] > MAX_ATTEMPTS:
+            api.update_coalesced_tasks(
+                task_id,
+                "failed",
+                "Failed to process video",
+                error=f"Job abandoned after {MAX_ATTEMPTS} lost workers",
+            )
+            return
+        if job["attempts"] > 1:
+            print(f"🔄 Resuming job {task_id} (attempt {job['attempts']})")
+
+        api.process_video_task(
+            task_id,
+            payload["video_url"],
+            payload.get("use_cache", True),
+            payload.get("queued_at"),
+            update=api.update_coalesced_tasks,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run jobs from the durable queue (WORKER_MODE=queue)"
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+        help="Jobs run at the same time (default: WORKER_CONCURRENCY)",
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if not isinstance(api.tasks, SQLiteTaskStore):
+        parser.error("queue workers need TASK_STORE=sqlite")
+
+    if api.SCAFFOLD_MODE == "stream":
+        # Streamed downloads build the zip from a manifest held in the API's
+        # memory, which a separate worker cannot fill
+        print("⚠️ SCAFFOLD_MODE=stream is not available to queue workers, using zip")
+        api.SCAFFOLD_MODE = "zip"
+
+    worker = QueueWorker(open_job_queue(), args.concurrency)
+    signal.signal(signal.SIGINT, worker.stop)
+    signal.signal(signal.SIGTERM, worker.stop)
+    try:
+        worker.run()
+    finally:
+        api.transcript_http_client.close()
+
+
+if __name__ == "__main__":
+    main()